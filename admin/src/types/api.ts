@@ -38,6 +38,7 @@ export type CountriesResponse = NumberTypeAvailability[];
 
 export interface SyncJobsResponse {
   jobs: SyncJob[];
+  next_after: string | null;
 }
 
 // Requirements detailed types
@@ -1,13 +1,21 @@
 """Database connection and session management using SQLAlchemy async."""
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base
-from app.config import settings
+from app.config import get_settings
+
+settings = get_settings()
 
 # Create async engine
 engine = create_async_engine(
     settings.database_url,
     echo=settings.debug,
     future=True,
+    # Keep prepared statements per connection so repeated queries skip the
+    # server-side parse/plan step (compiled SQL is already cached by SQLAlchemy)
+    connect_args={
+        "statement_cache_size": settings.db_statement_cache_size,
+        "prepared_statement_cache_size": settings.db_prepared_statement_cache_size,
+    },
 )
 
 # Create async session factory
@@ -19,6 +27,18 @@ AsyncSessionLocal = async_sessionmaker(
     autoflush=False,
 )
 
+# Read-only sessions run each statement in autocommit mode, skipping the
+# BEGIN/COMMIT round trips. This shares the main engine's connection pool.
+readonly_engine = engine.execution_options(isolation_level="AUTOCOMMIT")
+
+ReadOnlySessionLocal = async_sessionmaker(
+    readonly_engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autocommit=False,
+    autoflush=False,
+)
+
 # Base class for models
 Base = declarative_base()
 
@@ -38,3 +58,12 @@ async def get_db_session() -> AsyncSession:
         finally:
             await session.close()
 
+
+async def get_readonly_db_session() -> AsyncSession:
+    """
+    Dependency for getting a read-only database session.
+    Statements run in autocommit mode, so there is no transaction to commit or roll back.
+    Not suitable for server-side cursors (db.stream), which need a transaction.
+    """
+    async with ReadOnlySessionLocal() as session:
+        yield session
@@ -1,12 +1,21 @@
 """FastAPI application main entry point."""
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
+from arq import create_pool
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
+import asyncio
 import logging
 
-from app.config import settings
-from app.database import engine, Base
+from app.config import get_settings
+from app.database import engine, Base, ReadOnlySessionLocal
 from app.routers import sync, countries, regulations, numbers
+from app.routers.countries import refresh_countries_snapshot, watch_countries_updates
+from app.services.cache import response_cache
+from app.services.twilio_client import TwilioClient
+from app.tasks.worker import REDIS_SETTINGS
+
+settings = get_settings()
 
 # Configure logging
 logging.basicConfig(
@@ -20,18 +29,42 @@ logger = logging.getLogger(__name__)
 async def lifespan(app: FastAPI):
     """
     Lifespan context manager for startup and shutdown events.
-    Creates database tables on startup and disposes engine on shutdown.
+    Creates database tables, the response cache, the job queue pool and the shared
+    Twilio client on startup, and closes them and disposes the engine on shutdown.
     """
     # Startup: Create database tables
     logger.info("Starting up application...")
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
     logger.info("Database tables created/verified")
+    async with ReadOnlySessionLocal() as session:
+        await refresh_countries_snapshot(app, session)
+    logger.info("Country list snapshot loaded")
+    response_cache.init(host_url=settings.redis_url, prefix="tns-cache")
+    logger.info("Response cache initialized")
+    
+    # Sync jobs are queued to the arq worker; its completion events keep the snapshot fresh
+    app.state.arq_pool = await create_pool(REDIS_SETTINGS)
+    snapshot_watcher = asyncio.create_task(watch_countries_updates(app, app.state.arq_pool))
+    logger.info("Job queue connected")
+    
+    # Shared Twilio client so its connection pool is reused across requests
+    app.state.twilio_client = None
+    if settings.twilio_credentials_configured:
+        app.state.twilio_client = TwilioClient(settings.twilio_account_sid, settings.twilio_auth_token)
+        logger.info("Twilio client created")
     
     yield
     
     # Shutdown: Dispose database engine
     logger.info("Shutting down application...")
+    if app.state.twilio_client is not None:
+        await app.state.twilio_client.close()
+    snapshot_watcher.cancel()
+    with suppress(asyncio.CancelledError):
+        await snapshot_watcher
+    await app.state.arq_pool.aclose()
+    await response_cache.close()
     await engine.dispose()
     logger.info("Database engine disposed")
 
@@ -42,16 +75,18 @@ app = FastAPI(
     version=settings.app_version,
     description="Simplified API for searching Twilio phone numbers and querying regulatory compliance",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
 )
 
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],  # In production, specify allowed origins
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# Add CORS middleware only when cross-origin browser access is configured
+if settings.cors_origins:
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=settings.cors_origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
 
 # Include routers
 app.include_router(sync.router, prefix=settings.api_v1_prefix)
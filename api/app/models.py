@@ -1,5 +1,5 @@
 """SQLAlchemy async models for the application."""
-from sqlalchemy import Column, String, Boolean, DateTime, JSON
+from sqlalchemy import Column, String, Boolean, DateTime, JSON, Index
 from sqlalchemy.sql import func
 from app.database import Base
 
@@ -26,10 +26,14 @@ class Regulation(Base):
     """Model for storing Twilio regulatory compliance regulations."""
     
     __tablename__ = "regulations"
+    __table_args__ = (
+        # Matches the get_regulations predicate (country, end user type, optional number type)
+        Index("ix_reg_country_eut_type", "iso_country", "end_user_type", "number_type"),
+    )
     
     sid = Column(String(34), primary_key=True, index=True)
     friendly_name = Column(String(255), nullable=True)
-    iso_country = Column(String(2), nullable=True, index=True)
+    iso_country = Column(String(2), nullable=True)
     number_type = Column(String(50), nullable=True)
     end_user_type = Column(String(20), nullable=False, default="business")
     requirements = Column(JSON, nullable=True)
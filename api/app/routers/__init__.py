@@ -0,0 +1,11 @@
+"""API routers.
+
+Handlers return a Response directly (ORJSONResponse, orjson-encoded row
+mappings whose column types already match the schemas, or pydantic-core's
+model_dump_json) instead of model objects. That skips FastAPI's response_model
+validation and jsonable_encoder pass; response_model is still declared on each
+route so the OpenAPI docs describe the payload.
+
+Read queries are built with lambda_stmt, which caches the constructed statement
+per call site so later requests only extract the bound values.
+"""
@@ -1,27 +1,105 @@
 """Endpoints for querying country number types."""
-from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi import APIRouter, Depends, FastAPI, Header, HTTPException, Query, Request, Response
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, or_
+from sqlalchemy import select, lambda_stmt
 from typing import List, Optional
+import asyncio
+import logging
+import orjson
 
-from app.database import get_db_session
+from app.config import get_settings
+from app.database import ReadOnlySessionLocal, get_readonly_db_session
 from app.models import CountryNumberTypes
 from app.schemas import CountryNumberTypesResponse
+from app.services.cache import (
+    response_cache,
+    weak_etag,
+    etag_matches,
+    COUNTRIES_NAMESPACE,
+    COUNTRIES_UPDATED_CHANNEL,
+)
+from app.services.twilio_client import NUMBER_TYPES
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/countries", tags=["countries"])
 
+# Map number type filter values to their availability column
+_TYPE_COLUMN = {name: getattr(CountryNumberTypes, name) for name in NUMBER_TYPES}
+_TYPE_KEYS_STR = ", ".join(_TYPE_COLUMN)
+
+
+async def refresh_countries_snapshot(app: FastAPI, db: AsyncSession) -> None:
+    """
+    Pre-serialize the full country list onto app.state.
+    
+    Unfiltered first-page requests that cover every country are answered
+    from this payload without touching Redis or the database. Called on
+    startup and after each country sync.
+    
+    Args:
+        app: FastAPI application
+        db: Database session
+    """
+    result = await db.execute(select(CountryNumberTypes.__table__))
+    countries = [dict(row) for row in result.mappings()]
+    app.state.countries_json = orjson.dumps(countries)
+    app.state.countries_total = len(countries)
+
+
+async def watch_countries_updates(app: FastAPI, redis: Redis) -> None:
+    """
+    Refresh the country list snapshot whenever a country sync finishes.
+    
+    Runs for the life of the application, listening on COUNTRIES_UPDATED_CHANNEL
+    and resubscribing if the Redis connection drops. The snapshot is also
+    refreshed each time a (re)subscribe is confirmed, since a sync that
+    finished while no subscription was active would otherwise never be seen.
+    
+    Args:
+        app: FastAPI application
+        redis: Redis connection to subscribe with
+    """
+    async def refresh(reason: str) -> None:
+        try:
+            async with ReadOnlySessionLocal() as db:
+                await refresh_countries_snapshot(app, db)
+            logger.info(f"Country list snapshot refreshed {reason}")
+        except Exception as e:
+            logger.error(f"Failed to refresh country list snapshot: {e}")
+    
+    while True:
+        try:
+            async with redis.pubsub() as pubsub:
+                await pubsub.subscribe(COUNTRIES_UPDATED_CHANNEL)
+                async for message in pubsub.listen():
+                    # The subscribe confirmation arrives once the server is delivering updates
+                    if message["type"] == "subscribe":
+                        await refresh("after subscribing")
+                    elif message["type"] == "message":
+                        await refresh("after sync")
+        except RedisError as e:
+            logger.warning(f"Country update subscription lost: {e}")
+            await asyncio.sleep(5)
+
 
 @router.get("", response_model=List[CountryNumberTypesResponse])
 async def list_countries(
+    request: Request,
     skip: int = Query(0, ge=0, description="Number of records to skip"),
     limit: int = Query(100, ge=1, le=1000, description="Maximum number of records to return"),
     number_type: Optional[str] = Query(None, description="Filter by number type (local, toll_free, mobile, etc.)"),
-    db: AsyncSession = Depends(get_db_session)
+    db: AsyncSession = Depends(get_readonly_db_session)
 ):
     """
     List all countries with available number types.
+    Responses are cached until the next country sync.
     
     Args:
+        request: Incoming request (used as the cache key)
         skip: Pagination offset
         limit: Maximum number of results
         number_type: Optional filter by number type availability
@@ -30,60 +108,83 @@ async def list_countries(
     Returns:
         List of country number types
     """
-    query = select(CountryNumberTypes)
+    # Serve the whole catalogue from the pre-serialized snapshot when possible
+    snapshot = getattr(request.app.state, "countries_json", None)
+    if snapshot is not None and skip == 0 and number_type is None and limit >= request.app.state.countries_total:
+        return Response(content=snapshot, media_type="application/json")
+    
+    cache_key = response_cache.build_key(COUNTRIES_NAMESPACE, request)
+    cached = await response_cache.get(cache_key)
+    if cached is not None:
+        return Response(content=cached, media_type="application/json")
+    
+    # Core select of the table columns: rows come back as plain mappings
+    # without ORM identity-map bookkeeping
+    query = lambda_stmt(lambda: select(CountryNumberTypes.__table__))
     
     # Apply number type filter if provided
     if number_type:
-        # Map number type to column
-        type_mapping = {
-            "local": CountryNumberTypes.local,
-            "toll_free": CountryNumberTypes.toll_free,
-            "mobile": CountryNumberTypes.mobile,
-            "national": CountryNumberTypes.national,
-            "voip": CountryNumberTypes.voip,
-            "shared_cost": CountryNumberTypes.shared_cost,
-            "machine_to_machine": CountryNumberTypes.machine_to_machine,
-        }
-        
-        if number_type in type_mapping:
-            query = query.where(type_mapping[number_type] == True)
-        else:
+        column = _TYPE_COLUMN.get(number_type)
+        if column is None:
             raise HTTPException(
                 status_code=400,
-                detail=f"Invalid number type. Must be one of: {', '.join(type_mapping.keys())}"
+                detail=f"Invalid number type. Must be one of: {_TYPE_KEYS_STR}"
             )
+        query += lambda s: s.where(column.is_(True))
     
     # Apply pagination
-    query = query.offset(skip).limit(limit)
+    query += lambda s: s.offset(skip).limit(limit)
     
     result = await db.execute(query)
-    countries = result.scalars().all()
     
-    return [CountryNumberTypesResponse.model_validate(country) for country in countries]
+    payload = orjson.dumps([dict(row) for row in result.mappings()])
+    await response_cache.set(cache_key, payload, expire=settings.cache_ttl_seconds)
+    
+    return Response(content=payload, media_type="application/json")
 
 
 @router.get("/{country_code}", response_model=CountryNumberTypesResponse)
 async def get_country(
     country_code: str,
-    db: AsyncSession = Depends(get_db_session)
+    request: Request,
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_readonly_db_session)
 ):
     """
     Get number types for a specific country.
+    Responses are cached until the next country sync, and carry an ETag so
+    clients can revalidate with If-None-Match.
     
     Args:
         country_code: ISO country code (e.g., "US")
+        request: Incoming request (used as the cache key)
+        if_none_match: Optional If-None-Match header
         db: Database session
         
     Returns:
-        Country number types
+        Country number types, or 304 Not Modified if the client's copy is current
     """
-    query = select(CountryNumberTypes).where(CountryNumberTypes.country_code == country_code.upper())
+    country_code = country_code.upper()
+    cache_key = response_cache.build_key(COUNTRIES_NAMESPACE, request)
     
-    result = await db.execute(query)
-    country = result.scalar_one_or_none()
+    # The ETag is cached with the body, so one read answers both 304s and full responses
+    cached = await response_cache.get_tagged(cache_key)
+    if cached is not None:
+        etag, payload = cached
+    else:
+        query = lambda_stmt(lambda: select(CountryNumberTypes).where(CountryNumberTypes.country_code == country_code))
+        
+        result = await db.execute(query)
+        country = result.scalar_one_or_none()
+        
+        if not country:
+            raise HTTPException(status_code=404, detail=f"Country {country_code} not found")
+        
+        etag = weak_etag(country.last_updated)
+        payload = CountryNumberTypesResponse.model_validate(country).model_dump_json().encode()
+        await response_cache.set_tagged(cache_key, etag, payload, expire=settings.cache_ttl_seconds)
     
-    if not country:
-        raise HTTPException(status_code=404, detail=f"Country {country_code} not found")
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
     
-    return CountryNumberTypesResponse.model_validate(country)
-
+    return Response(content=payload, media_type="application/json", headers={"ETag": etag})
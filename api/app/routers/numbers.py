@@ -1,28 +1,70 @@
 """Endpoints for searching available Twilio phone numbers."""
-from fastapi import APIRouter, HTTPException
-from typing import List
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import ORJSONResponse
+from typing import Any, Dict, List
 import logging
 
-from app.config import settings
+from app.config import require_twilio_credentials
 from app.schemas import NumberSearchRequest, AvailableNumberResponse
-from app.services.twilio_client import TwilioClient, TwilioAPIError, TwilioRateLimitError
+from app.services.twilio_client import TwilioAPIError, TwilioRateLimitError
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/numbers", tags=["numbers"])
 
+# Fields copied as-is from a Twilio available number onto AvailableNumberResponse
+_NUMBER_FIELDS = (
+    "phone_number",
+    "friendly_name",
+    "iso_country",
+    "address_requirements",
+    "beta",
+    "lata",
+    "locality",
+    "rate_center",
+    "latitude",
+    "longitude",
+    "region",
+    "postal_code",
+)
+_COORDINATE_FIELDS = ("latitude", "longitude")
 
-def _validate_twilio_credentials():
-    """Validate that Twilio credentials are configured."""
-    if not settings.twilio_account_sid or not settings.twilio_auth_token:
-        raise HTTPException(
-            status_code=500,
-            detail="Twilio credentials are not configured. Please set TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN environment variables."
-        )
+
+def _build_number_response(number: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Build an AvailableNumberResponse-shaped dict from a Twilio available number.
+    
+    The dict is encoded by orjson directly, so the few fields Twilio returns
+    in a different type than the schema are converted here.
+    """
+    result = {field: number.get(field) for field in _NUMBER_FIELDS}
+    
+    # Twilio returns coordinates as strings
+    for field in _COORDINATE_FIELDS:
+        if result[field] is not None:
+            result[field] = float(result[field])
+    
+    # Handle capabilities if present
+    # Twilio returns capabilities with mixed casing: 'MMS', 'SMS' (uppercase), 'voice' (lowercase)
+    # We need to normalize to lowercase to match our schema
+    capabilities = None
+    caps = number.get("capabilities")
+    if caps:
+        # Normalize capabilities keys to lowercase
+        caps = {key.lower(): value for key, value in caps.items()}
+        capabilities = {
+            "mms": caps.get("mms"),
+            "sms": caps.get("sms"),
+            "voice": caps.get("voice"),
+            "fax": caps.get("fax"),
+        }
+    result["capabilities"] = capabilities
+    
+    return result
 
 
 @router.post("/search", response_model=List[AvailableNumberResponse])
-async def search_numbers(request: NumberSearchRequest):
+async def search_numbers(request: NumberSearchRequest, http_request: Request):
     """
     Search for available phone numbers by country and number type.
     
@@ -34,6 +76,7 @@ async def search_numbers(request: NumberSearchRequest):
     
     Args:
         request: Search request containing country_code, number_type, and optional filters
+        http_request: Incoming HTTP request (used to reach the shared Twilio client)
         
     Returns:
         List of available phone numbers matching the criteria
@@ -43,13 +86,12 @@ async def search_numbers(request: NumberSearchRequest):
         500: If Twilio API error occurs or credentials are not configured
     """
     # Validate credentials are configured
-    _validate_twilio_credentials()
+    require_twilio_credentials()
+    
+    # Shared client created at startup with credentials from settings
+    client = http_request.app.state.twilio_client
     
-    client = None
     try:
-        # Create Twilio client with credentials from settings
-        client = TwilioClient(settings.twilio_account_sid, settings.twilio_auth_token)
-        
         logger.info(f"Searching for {request.number_type.value} numbers in {request.country_code} with sms_enabled={request.sms_enabled}, voice_enabled={request.voice_enabled}")
         
         # Search for available numbers
@@ -62,43 +104,11 @@ async def search_numbers(request: NumberSearchRequest):
         
         logger.info(f"Twilio API returned {len(numbers)} numbers")
         
-        # Convert to response models
-        result = []
-        for number in numbers:
-            # Handle capabilities if present
-            # Twilio returns capabilities with mixed casing: 'MMS', 'SMS' (uppercase), 'voice' (lowercase)
-            # We need to normalize to lowercase to match our schema
-            capabilities = None
-            if "capabilities" in number and number["capabilities"]:
-                from app.schemas import PhoneNumberCapabilities
-                # Normalize capabilities keys to lowercase
-                caps = number["capabilities"]
-                normalized_caps = {
-                    "mms": caps.get("MMS") if "MMS" in caps else caps.get("mms"),
-                    "sms": caps.get("SMS") if "SMS" in caps else caps.get("sms"),
-                    "voice": caps.get("voice") if "voice" in caps else caps.get("Voice"),
-                    "fax": caps.get("fax") if "fax" in caps else caps.get("Fax"),
-                }
-                capabilities = PhoneNumberCapabilities(**normalized_caps)
-            
-            result.append(AvailableNumberResponse(
-                phone_number=number.get("phone_number"),
-                friendly_name=number.get("friendly_name"),
-                capabilities=capabilities,
-                iso_country=number.get("iso_country"),
-                address_requirements=number.get("address_requirements"),
-                beta=number.get("beta"),
-                lata=number.get("lata"),
-                locality=number.get("locality"),
-                rate_center=number.get("rate_center"),
-                latitude=number.get("latitude"),
-                longitude=number.get("longitude"),
-                region=number.get("region"),
-                postal_code=number.get("postal_code")
-            ))
+        # Convert to response dicts
+        result = [_build_number_response(number) for number in numbers]
         
         logger.info(f"Found {len(result)} available {request.number_type.value} numbers for {request.country_code}")
-        return result
+        return ORJSONResponse(content=result)
         
     except TwilioAPIError as e:
         logger.error(f"Twilio API error: {e}")
@@ -109,7 +119,4 @@ async def search_numbers(request: NumberSearchRequest):
     except Exception as e:
         logger.error(f"Unexpected error searching numbers: {e}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
-    finally:
-        if client:
-            await client.close()
 
@@ -1,32 +1,161 @@
 """Endpoints for querying regulatory compliance regulations."""
-from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, and_, or_
-from typing import List, Optional
+from sqlalchemy import select, and_, or_, exists, func, lambda_stmt
+from contextlib import aclosing
+from typing import BinaryIO, List, Optional, Tuple
+import os
 from pydantic import BaseModel
+import orjson
 
-from app.database import get_db_session
+from app.config import get_settings
+from app.database import get_db_session, get_readonly_db_session
 from app.models import Regulation, CountryNumberTypes
 from app.schemas import RegulationResponse
-from app.services.excel_export import generate_regulation_excel
+from app.services.cache import response_cache, weak_etag, etag_matches, REGULATIONS_NAMESPACE
+from app.services.excel_export import generate_regulation_excel, generate_regulation_excel_from_stream
+from app.services.twilio_client import NUMBER_TYPES
 import logging
 
+settings = get_settings()
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/regulations", tags=["regulations"])
 
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+# Regulation columns read by the Excel export
+_EXPORT_COLUMNS = (
+    Regulation.sid,
+    Regulation.friendly_name,
+    Regulation.iso_country,
+    Regulation.number_type,
+    Regulation.end_user_type,
+    Regulation.requirements,
+    Regulation.last_updated,
+)
+
+
+# True when a regulation's number type is flagged available on the correlated
+# country_number_types row (used inside EXISTS subqueries against that table)
+_TYPE_IS_AVAILABLE = or_(*(
+    and_(Regulation.number_type == name, getattr(CountryNumberTypes, name).is_(True))
+    for name in NUMBER_TYPES
+))
+
 
 class ExportRegulationsRequest(BaseModel):
     """Request schema for exporting multiple regulations."""
     regulation_sids: List[str] = []
 
 
+def _excel_response(excel_file: BinaryIO, filename: str) -> StreamingResponse:
+    """
+    Stream a generated Excel file as a download without reading it into a bytes object.
+    
+    Args:
+        excel_file: File containing the generated workbook (closed once the response is sent)
+        filename: Download filename for the Content-Disposition header
+        
+    Returns:
+        StreamingResponse reading the file in fixed-size chunks
+    """
+    content_length = excel_file.seek(0, os.SEEK_END)
+    excel_file.seek(0)
+    return StreamingResponse(
+        iter(lambda: excel_file.read(EXPORT_CHUNK_SIZE), b""),
+        media_type=XLSX_MEDIA_TYPE,
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Content-Length": str(content_length),
+        },
+        background=BackgroundTask(excel_file.close),
+    )
+
+
+async def _load_regulations(
+    db: AsyncSession,
+    country_code: str,
+    number_type: Optional[str],
+    only_available_types: bool
+) -> Tuple[str, bytes]:
+    """
+    Query a country's business regulations and serialize them with their ETag.
+    
+    Args:
+        db: Database session
+        country_code: Upper-case ISO country code
+        number_type: Optional filter by number type
+        only_available_types: Only keep regulations for phone types available in the country
+        
+    Returns:
+        Tuple of the weak ETag and the JSON-encoded regulations
+        
+    Raises:
+        404: If no regulations found for the country
+    """
+    not_found_detail = f"No regulations found for country {country_code}. Sync regulations first using POST /api/v1/sync/regulations"
+    
+    # The ETag covers the latest regulation and country updates (country types
+    # affect only_available_types)
+    etag_query = lambda_stmt(lambda: select(
+        func.max(Regulation.last_updated),
+        select(CountryNumberTypes.last_updated)
+        .where(CountryNumberTypes.country_code == country_code)
+        .scalar_subquery(),
+    ).where(
+        Regulation.iso_country == country_code,
+        Regulation.end_user_type == "business"
+    ))
+    regulations_updated, country_updated = (await db.execute(etag_query)).one()
+    if regulations_updated is None:
+        raise HTTPException(status_code=404, detail=not_found_detail)
+    etag = weak_etag(regulations_updated, country_updated)
+    
+    # Build query (Core select of the table columns, returned as plain mappings)
+    query = lambda_stmt(lambda: select(Regulation.__table__).where(
+        Regulation.iso_country == country_code,
+        Regulation.end_user_type == "business"
+    ))
+    
+    # Apply number type filter if provided
+    if number_type:
+        query += lambda s: s.where(Regulation.number_type == number_type)
+    
+    # Filter by available types if enabled. General regulations (number_type is None)
+    # are always kept, and if the country has not been synced every regulation is kept.
+    # The country row is checked with correlated EXISTS subqueries so the filter runs
+    # in the same statement as the regulations query.
+    if only_available_types:
+        query += lambda s: s.where(or_(
+            Regulation.number_type.is_(None),
+            ~exists().where(CountryNumberTypes.country_code == country_code),
+            exists().where(CountryNumberTypes.country_code == country_code, _TYPE_IS_AVAILABLE),
+        ))
+    
+    # Query database
+    result = await db.execute(query)
+    regulations = result.mappings().all()
+    
+    # Return 404 if no regulations found
+    if not regulations:
+        raise HTTPException(status_code=404, detail=not_found_detail)
+    
+    return etag, orjson.dumps([dict(regulation) for regulation in regulations])
+
+
 @router.get("/{country_code}", response_model=List[RegulationResponse])
 async def get_regulations(
     country_code: str,
+    request: Request,
     number_type: Optional[str] = Query(None, description="Filter by number type (local, toll_free, mobile, etc.)"),
     only_available_types: bool = Query(False, description="Only show regulations for available phone types (default: False to show all regulations including private offerings)"),
-    db: AsyncSession = Depends(get_db_session)
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_readonly_db_session)
 ):
     """
     Get regulatory requirements for a specific country.
@@ -35,90 +164,45 @@ async def get_regulations(
     
     By default, returns all regulations regardless of number type availability, as some
     number types are available through private offerings and not exposed in the public API.
+    Responses are cached until the next sync, and carry an ETag so clients
+    can revalidate with If-None-Match.
     
     Args:
         country_code: ISO country code (e.g., "US")
+        request: Incoming request (used as the cache key)
         number_type: Optional filter by number type
         only_available_types: Only show regulations for phone types available in the country (default: False)
+        if_none_match: Optional If-None-Match header
         db: Database session
         
     Returns:
-        List of regulations for the specified country
+        List of regulations for the specified country, or 304 Not Modified if the client's copy is current
         
     Raises:
         404: If no regulations found for the country
     """
     country_code = country_code.upper()
     
-    # Build query
-    query = select(Regulation).where(
-        and_(
-            Regulation.iso_country == country_code,
-            Regulation.end_user_type == "business"
-        )
-    )
-    
-    # Apply number type filter if provided
-    if number_type:
-        query = query.where(Regulation.number_type == number_type)
+    cache_key = response_cache.build_key(REGULATIONS_NAMESPACE, request)
     
-    # Filter by available types if enabled
-    if only_available_types:
-        # Query CountryNumberTypes to get available types for this country
-        country_types_query = select(CountryNumberTypes).where(
-            CountryNumberTypes.country_code == country_code
-        )
-        country_types_result = await db.execute(country_types_query)
-        country_types = country_types_result.scalar_one_or_none()
-        
-        if country_types:
-            # Build list of available number types
-            available_types = []
-            type_mapping = {
-                "local": country_types.local,
-                "toll_free": country_types.toll_free,
-                "mobile": country_types.mobile,
-                "national": country_types.national,
-                "voip": country_types.voip,
-                "shared_cost": country_types.shared_cost,
-                "machine_to_machine": country_types.machine_to_machine,
-            }
-            
-            for type_name, is_available in type_mapping.items():
-                if is_available:
-                    available_types.append(type_name)
-            
-            # Filter regulations: include those with number_type in available_types or number_type is None
-            if available_types:
-                query = query.where(
-                    or_(
-                        Regulation.number_type.in_(available_types),
-                        Regulation.number_type.is_(None)
-                    )
-                )
-            else:
-                # No available types, only include general regulations (number_type is None)
-                query = query.where(Regulation.number_type.is_(None))
-        # If country_types is None, fallback to returning all regulations (country data not synced)
+    # The ETag is cached with the body, so one read answers both 304s and full responses
+    cached = await response_cache.get_tagged(cache_key)
+    if cached is not None:
+        etag, payload = cached
+    else:
+        etag, payload = await _load_regulations(db, country_code, number_type, only_available_types)
+        await response_cache.set_tagged(cache_key, etag, payload, expire=settings.cache_ttl_seconds)
     
-    # Query database
-    result = await db.execute(query)
-    regulations = result.scalars().all()
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={"ETag": etag})
     
-    # Return 404 if no regulations found
-    if not regulations:
-        raise HTTPException(
-            status_code=404,
-            detail=f"No regulations found for country {country_code}. Sync regulations first using POST /api/v1/sync/regulations"
-        )
-    
-    return [RegulationResponse.model_validate(regulation) for regulation in regulations]
+    return Response(content=payload, media_type="application/json", headers={"ETag": etag})
 
 
 @router.get("/{regulation_sid}/export")
 async def export_regulation(
     regulation_sid: str,
-    db: AsyncSession = Depends(get_db_session)
+    db: AsyncSession = Depends(get_readonly_db_session)
 ):
     """
     Export a single regulation as an Excel template/checklist.
@@ -130,10 +214,10 @@ async def export_regulation(
     Returns:
         Excel file download
     """
-    # Query the regulation
-    query = select(Regulation).where(Regulation.sid == regulation_sid)
+    # Query the regulation; the row mapping is passed to the exporter as-is
+    query = lambda_stmt(lambda: select(*_EXPORT_COLUMNS).where(Regulation.sid == regulation_sid))
     result = await db.execute(query)
-    regulation = result.scalar_one_or_none()
+    regulation = result.mappings().one_or_none()
     
     if not regulation:
         raise HTTPException(
@@ -141,35 +225,18 @@ async def export_regulation(
             detail=f"Regulation {regulation_sid} not found"
         )
     
-    # Convert to dict for Excel export
-    regulation_dict = {
-        'sid': regulation.sid,
-        'friendly_name': regulation.friendly_name,
-        'iso_country': regulation.iso_country,
-        'number_type': regulation.number_type,
-        'end_user_type': regulation.end_user_type,
-        'requirements': regulation.requirements,
-        'last_updated': regulation.last_updated,
-    }
-    
-    # Generate Excel file
-    excel_file = generate_regulation_excel([regulation_dict])
+    # Generate Excel file (CPU-bound, so off the event loop)
+    excel_file = await run_in_threadpool(generate_regulation_excel, [regulation])
     
     # Generate filename
     filename = f"regulation_{regulation_sid[:8]}.xlsx"
-    if regulation.friendly_name:
+    if regulation["friendly_name"]:
         # Sanitize filename
-        safe_name = "".join(c for c in regulation.friendly_name[:30] if c.isalnum() or c in (' ', '-', '_')).strip()
+        safe_name = "".join(c for c in regulation["friendly_name"][:30] if c.isalnum() or c in (' ', '-', '_')).strip()
         filename = f"{safe_name}_{regulation_sid[:8]}.xlsx"
     
     # Return file as response
-    return Response(
-        content=excel_file.read(),
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={
-            "Content-Disposition": f'attachment; filename="{filename}"'
-        }
-    )
+    return _excel_response(excel_file, filename)
 
 
 @router.post("/export")
@@ -193,48 +260,35 @@ async def export_regulations(
             detail="At least one regulation SID is required"
         )
     
-    # Query all regulations
-    query = select(Regulation).where(Regulation.sid.in_(request.regulation_sids))
-    result = await db.execute(query)
-    regulations = result.scalars().all()
+    # Stream regulations from the database straight into the workbook
+    query = select(*_EXPORT_COLUMNS).where(Regulation.sid.in_(request.regulation_sids))
+    found_sids = set()
     
-    if not regulations:
+    async def stream_regulations():
+        result = await db.stream(query)
+        async for regulation in result.mappings():
+            found_sids.add(regulation["sid"])
+            yield regulation
+    
+    # Generate Excel file (aclosing releases the database stream if generation fails)
+    async with aclosing(stream_regulations()) as regulations:
+        excel_file = await generate_regulation_excel_from_stream(regulations)
+    
+    if not found_sids:
+        excel_file.close()
         raise HTTPException(
             status_code=404,
             detail="No regulations found for the provided SIDs"
         )
     
     # Check if all requested regulations were found
-    found_sids = {reg.sid for reg in regulations}
     missing_sids = set(request.regulation_sids) - found_sids
     if missing_sids:
         logger.warning(f"Some regulation SIDs not found: {missing_sids}")
     
-    # Convert to dicts for Excel export
-    regulation_dicts = []
-    for regulation in regulations:
-        regulation_dicts.append({
-            'sid': regulation.sid,
-            'friendly_name': regulation.friendly_name,
-            'iso_country': regulation.iso_country,
-            'number_type': regulation.number_type,
-            'end_user_type': regulation.end_user_type,
-            'requirements': regulation.requirements,
-            'last_updated': regulation.last_updated,
-        })
-    
-    # Generate Excel file
-    excel_file = generate_regulation_excel(regulation_dicts)
-    
     # Generate filename
-    filename = f"regulations_export_{len(regulation_dicts)}_regulations.xlsx"
+    filename = f"regulations_export_{len(found_sids)}_regulations.xlsx"
     
     # Return file as response
-    return Response(
-        content=excel_file.read(),
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-        headers={
-            "Content-Disposition": f'attachment; filename="{filename}"'
-        }
-    )
+    return _excel_response(excel_file, filename)
 
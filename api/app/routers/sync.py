@@ -1,201 +1,192 @@
 """Sync endpoints for triggering and monitoring Twilio data sync."""
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
-from sqlalchemy.ext.asyncio import AsyncSession
-from typing import Dict, Optional
-import uuid
-
-from app.database import get_db_session
-from app.config import settings
-from app.schemas import SyncRequest, SyncStatus
+from fastapi import APIRouter, HTTPException, Query, Request, Response
+from fastapi.responses import ORJSONResponse
+from redis.asyncio import Redis
+from typing import Dict, Optional, Tuple
+import asyncio
+import time
+
+from app.config import require_twilio_credentials
+from app.schemas import SyncJobList, SyncRequest, SyncStatus
 from app.tasks.sync_task import (
-    sync_twilio_number_types,
+    create_sync_job,
     get_sync_job_status,
-    upsert_countries_to_db,
-    sync_twilio_regulations,
-    upsert_regulations_to_db,
+    list_sync_job_statuses,
+    new_sync_job_id,
 )
 import logging
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter(prefix="/sync", tags=["sync"])
-
-
-def _validate_twilio_credentials():
-    """Validate that Twilio credentials are configured."""
-    if not settings.twilio_account_sid or not settings.twilio_auth_token:
-        raise HTTPException(
-            status_code=500,
-            detail="Twilio credentials are not configured. Please set TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN environment variables."
-        )
-
-
-async def run_sync_task(
-    account_sid: str,
-    auth_token: str,
-    job_id: str,
-    db: AsyncSession
-):
-    """Background task wrapper that handles database operations."""
-    try:
-        # Run the sync task
-        countries_data = await sync_twilio_number_types(account_sid, auth_token, job_id)
-        
-        # Upsert to database
-        if countries_data:
-            await upsert_countries_to_db(db, countries_data)
-            
-    except Exception as e:
-        logger.error(f"Sync task {job_id} failed: {e}")
-        job_status = get_sync_job_status(job_id)
-        if job_status:
-            job_status["error"] = str(e)
-            job_status["status"] = "failed"
+router = APIRouter(prefix="/sync", tags=["sync"], default_response_class=ORJSONResponse)
 
 
-async def run_regulations_sync_task(
-    account_sid: str,
-    auth_token: str,
-    job_id: str,
-    db: AsyncSession
-):
-    """Background task wrapper for regulations sync that handles database operations."""
-    try:
-        # Run the regulations sync task
-        regulations_data = await sync_twilio_regulations(account_sid, auth_token, job_id)
-        
-        # Upsert to database
-        if regulations_data:
-            await upsert_regulations_to_db(db, regulations_data)
-            
-    except Exception as e:
-        logger.error(f"Regulations sync task {job_id} failed: {e}")
-        job_status = get_sync_job_status(job_id)
-        if job_status:
-            job_status["error"] = str(e)
-            job_status["status"] = "failed"
+# Status polls are answered from a short-lived per-process copy of the serialized
+# status, so many clients polling the same job cost one Redis read per interval
+STATUS_CACHE_TTL_SECONDS = 1
+_STATUS_CACHE_CONTROL = f"private, max-age={STATUS_CACHE_TTL_SECONDS}"
+_status_cache: Dict[str, Tuple[float, str]] = {}
+# In-flight status reads by job ID, so concurrent misses for the same job share
+# one Redis read without waiting on reads for other jobs
+_status_fetches: Dict[str, asyncio.Task] = {}
 
 
 @router.post("", response_model=Dict[str, str], status_code=202)
-async def trigger_sync(
-    background_tasks: BackgroundTasks,
-    db: AsyncSession = Depends(get_db_session)
-):
+async def trigger_sync(request: Request):
     """
     Trigger a sync of Twilio number types.
     
+    The sync runs on the arq worker (see app.tasks.worker).
+    
     Note: Twilio credentials are loaded from environment variables.
     Request body can be empty.
     
+    Args:
+        request: Incoming request (used to reach the job queue)
+    
     Returns:
         Job ID for tracking sync status
     """
     # Validate credentials are configured
-    _validate_twilio_credentials()
+    require_twilio_credentials()
     
-    job_id = str(uuid.uuid4())
+    job_id = new_sync_job_id()
+    arq_pool = request.app.state.arq_pool
     
-    # Start background task with credentials from settings
-    background_tasks.add_task(
-        run_sync_task,
-        settings.twilio_account_sid,
-        settings.twilio_auth_token,
-        job_id,
-        db
-    )
+    # Record the job before queueing it so status polls find it straight away.
+    # The worker reads credentials from its own settings, so they are never queued.
+    await create_sync_job(arq_pool, job_id)
+    await arq_pool.enqueue_job("sync_countries_job", job_id, _job_id=job_id)
     
     logger.info(f"Started sync job {job_id}")
     
-    return {"job_id": job_id, "status": "accepted"}
+    return ORJSONResponse(content={"job_id": job_id, "status": "accepted"}, status_code=202)
+
+
+async def _fetch_status_payload(redis: Redis, job_id: str) -> Optional[str]:
+    """
+    Read a job's status from Redis, serialize it and store it in the status cache.
+    
+    Args:
+        redis: Redis connection holding the job status
+        job_id: Job ID to look up
+        
+    Returns:
+        Serialized SyncStatus, or None if the job does not exist
+    """
+    try:
+        job_status = await get_sync_job_status(redis, job_id)
+        if not job_status:
+            return None
+        
+        payload = SyncStatus.model_validate(job_status, from_attributes=True).model_dump_json()
+        
+        # Drop expired entries so finished jobs do not accumulate
+        now = time.monotonic()
+        for expired_id in [key for key, (expires, _) in _status_cache.items() if expires <= now]:
+            del _status_cache[expired_id]
+        _status_cache[job_id] = (now + STATUS_CACHE_TTL_SECONDS, payload)
+        return payload
+    finally:
+        _status_fetches.pop(job_id, None)
 
 
 @router.get("/{job_id}", response_model=SyncStatus)
-async def get_sync_status(job_id: str):
+async def get_sync_status(job_id: str, request: Request):
     """
     Get status of a sync job.
     
     Args:
         job_id: Job ID returned from trigger_sync
+        request: Incoming request (used to reach the job store)
         
     Returns:
-        Sync job status
+        Sync job status (may be up to STATUS_CACHE_TTL_SECONDS old)
     """
-    job_status = get_sync_job_status(job_id)
-    
-    if not job_status:
+    headers = {"Cache-Control": _STATUS_CACHE_CONTROL}
+    cached = _status_cache.get(job_id)
+    if cached is not None and cached[0] > time.monotonic():
+        return Response(content=cached[1], media_type="application/json", headers=headers)
+    
+    # Concurrent polls that miss wait for a single read of this job's status
+    fetch = _status_fetches.get(job_id)
+    if fetch is None:
+        fetch = asyncio.create_task(_fetch_status_payload(request.app.state.arq_pool, job_id))
+        _status_fetches[job_id] = fetch
+    # Shielded so one poller disconnecting does not cancel the read for the others
+    payload = await asyncio.shield(fetch)
+    
+    if payload is None:
         raise HTTPException(status_code=404, detail="Job not found")
     
-    return SyncStatus(
-        job_id=job_id,
-        status=job_status["status"],
-        started_at=job_status.get("started_at"),
-        completed_at=job_status.get("completed_at"),
-        countries_processed=job_status.get("countries_processed", 0),
-        countries_total=job_status.get("countries_total"),
-        error=job_status.get("error"),
-    )
+    return Response(content=payload, media_type="application/json", headers=headers)
 
 
 @router.post("/regulations", response_model=Dict[str, str], status_code=202)
 async def trigger_regulations_sync(
-    background_tasks: BackgroundTasks,
-    db: AsyncSession = Depends(get_db_session)
+    request: Request,
+    refresh_countries: bool = Query(False, description="Refetch the Twilio country list instead of reusing the worker's cached copy")
 ):
     """
     Trigger a sync of Twilio regulatory compliance regulations.
     
+    The sync runs on the arq worker (see app.tasks.worker).
+    
     Note: Twilio credentials are loaded from environment variables.
     Request body can be empty.
     
+    Args:
+        request: Incoming request (used to reach the job queue)
+        refresh_countries: Refetch the country list even if the worker
+            fetched it within the last COUNTRIES_CACHE_TTL_SECONDS
+    
     Returns:
         Job ID for tracking sync status
     """
     # Validate credentials are configured
-    _validate_twilio_credentials()
+    require_twilio_credentials()
     
-    job_id = str(uuid.uuid4())
+    job_id = new_sync_job_id()
+    arq_pool = request.app.state.arq_pool
     
-    # Start background task with credentials from settings
-    background_tasks.add_task(
-        run_regulations_sync_task,
-        settings.twilio_account_sid,
-        settings.twilio_auth_token,
-        job_id,
-        db
-    )
+    # Record the job before queueing it so status polls find it straight away
+    await create_sync_job(arq_pool, job_id)
+    await arq_pool.enqueue_job("sync_regulations_job", job_id, refresh_countries, _job_id=job_id)
     
     logger.info(f"Started regulations sync job {job_id}")
     
-    return {"job_id": job_id, "status": "accepted"}
+    return ORJSONResponse(content={"job_id": job_id, "status": "accepted"}, status_code=202)
 
 
-@router.get("", response_model=Dict[str, list])
-async def list_sync_jobs(limit: int = 10):
+@router.get("", response_model=SyncJobList)
+async def list_sync_jobs(
+    request: Request,
+    limit: int = Query(10, ge=1, le=100, description="Maximum number of jobs to return"),
+    after: Optional[str] = Query(None, description="Job ID cursor (next_after from the previous page)")
+):
     """
-    List recent sync jobs.
+    List recent sync jobs, newest first.
     
     Args:
+        request: Incoming request (used to reach the job store)
         limit: Maximum number of jobs to return
+        after: Optional cursor; only jobs created before this job are returned
         
     Returns:
-        List of sync job statuses
+        Page of sync job statuses and the cursor for the next page
+        
+    Raises:
+        400: If the cursor is not a valid job ID
     """
-    from app.tasks.sync_task import sync_jobs
-    
-    # Get most recent jobs (simple implementation - in production, use proper sorting)
-    jobs = list(sync_jobs.items())[-limit:]
-    
-    return {
-        "jobs": [
-            {
-                "job_id": job_id,
-                "status": status["status"],
-                "started_at": status.get("started_at"),
-                "completed_at": status.get("completed_at"),
-                "countries_processed": status.get("countries_processed", 0),
-                "countries_total": status.get("countries_total"),
-            }
-            for job_id, status in jobs
-        ]
-    }
-
+    try:
+        jobs = await list_sync_job_statuses(request.app.state.arq_pool, limit, after)
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {after}")
+    
+    # A full page may have more jobs behind it
+    page = SyncJobList(
+        jobs=[SyncStatus.model_validate(job, from_attributes=True) for job in jobs],
+        next_after=jobs[-1].job_id if len(jobs) == limit else None,
+    )
+    
+    return Response(content=page.model_dump_json(), media_type="application/json")
@@ -1,5 +1,5 @@
 """Pydantic schemas for request and response validation."""
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from datetime import datetime
 from typing import Optional, Any, List, Dict
 from enum import Enum
@@ -28,8 +28,7 @@ class CountryNumberTypesResponse(CountryNumberTypesBase):
     """Response schema for country number types."""
     last_updated: datetime
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class SyncRequest(BaseModel):
@@ -43,6 +42,9 @@ class SyncRequest(BaseModel):
 
 class SyncStatus(BaseModel):
     """Schema for sync job status."""
+    # Built from a SyncJobState and never modified afterwards
+    model_config = ConfigDict(from_attributes=True, frozen=True)
+    
     job_id: str
     status: str = Field(..., description="Status: pending, in_progress, completed, failed")
     started_at: Optional[datetime] = None
@@ -52,6 +54,12 @@ class SyncStatus(BaseModel):
     error: Optional[str] = None
 
 
+class SyncJobList(BaseModel):
+    """Schema for a page of sync jobs, newest first."""
+    jobs: List[SyncStatus]
+    next_after: Optional[str] = Field(None, description="Cursor for the next page (pass as after), or null on the last page")
+
+
 class RegulationBase(BaseModel):
     """Base schema for regulatory compliance regulations."""
     sid: str = Field(..., min_length=34, max_length=34, description="Unique regulation identifier")
@@ -67,8 +75,7 @@ class RegulationResponse(RegulationBase):
     """Response schema for regulatory compliance regulations."""
     last_updated: datetime = Field(default_factory=lambda: datetime.utcnow())
     
-    class Config:
-        from_attributes = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 class NumberType(str, Enum):
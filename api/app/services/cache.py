@@ -0,0 +1,147 @@
+"""Redis-backed response cache for read-heavy endpoints."""
+from datetime import datetime
+from typing import Optional, Tuple
+import logging
+
+from fastapi import Request
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+# Cache namespaces, invalidated independently when the matching data is synced
+COUNTRIES_NAMESPACE = "countries"
+REGULATIONS_NAMESPACE = "regulations"
+
+# Published by the sync worker after country data changes
+COUNTRIES_UPDATED_CHANNEL = "tns:countries-updated"
+
+
+def weak_etag(*timestamps: Optional[datetime]) -> str:
+    """
+    Build a weak ETag from the last-updated timestamps behind a response.
+    
+    Args:
+        *timestamps: Timestamps of the data the response is built from (None values are skipped)
+        
+    Returns:
+        Weak entity tag, e.g. W/"5f1c2a3b4d5e6"
+    """
+    tag = "-".join(f"{int(ts.timestamp() * 1_000_000):x}" for ts in timestamps if ts is not None)
+    return f'W/"{tag}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Check an If-None-Match header against an ETag using weak comparison.
+    
+    Args:
+        if_none_match: Raw If-None-Match header value (may list several tags or be "*")
+        etag: Current ETag of the resource
+        
+    Returns:
+        True if the client's cached copy is still current
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in if_none_match.split(","))
+
+
+class ResponseCache:
+    """
+    Caches serialized JSON response bodies in Redis.
+
+    Keys are built from the request path and sorted query parameters under a
+    namespace, so a sync can drop every cached response for that data set.
+    Redis errors are logged and treated as cache misses so the API keeps
+    serving from the database when Redis is unavailable.
+    """
+
+    def __init__(self):
+        self.redis: Optional[Redis] = None
+        self.prefix = "tns-cache"
+
+    def init(self, host_url: str, prefix: str = "tns-cache") -> None:
+        """
+        Create the Redis connection pool.
+
+        Args:
+            host_url: Redis connection URL (e.g., "redis://localhost:6379/0")
+            prefix: Prefix applied to every cache key
+        """
+        self.redis = Redis.from_url(host_url)
+        self.prefix = prefix
+
+    async def close(self) -> None:
+        """Close the Redis connection pool."""
+        if self.redis is not None:
+            await self.redis.aclose()
+            self.redis = None
+
+    def build_key(self, namespace: str, request: Request) -> str:
+        """
+        Build a cache key for a request.
+
+        Args:
+            namespace: Cache namespace (e.g., COUNTRIES_NAMESPACE)
+            request: Incoming request
+
+        Returns:
+            Cache key of the form "<prefix>:<namespace>:<path>?<sorted query>"
+        """
+        query = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+        return f"{self.prefix}:{namespace}:{request.url.path}?{query}"
+
+    async def get(self, key: str) -> Optional[bytes]:
+        """Return the cached payload for key, or None on a miss."""
+        if self.redis is None:
+            return None
+        try:
+            return await self.redis.get(key)
+        except RedisError as e:
+            logger.warning(f"Cache read failed for {key}: {e}")
+            return None
+
+    async def set(self, key: str, payload: bytes, expire: int) -> None:
+        """Store payload under key with a TTL in seconds."""
+        if self.redis is None:
+            return
+        try:
+            await self.redis.set(key, payload, ex=expire)
+        except RedisError as e:
+            logger.warning(f"Cache write failed for {key}: {e}")
+
+    async def get_tagged(self, key: str) -> Optional[Tuple[str, bytes]]:
+        """
+        Return the ETag and payload cached together under key, or None on a miss.
+        
+        Both come from one Redis value, so the ETag can never describe a
+        different body than the one returned with it.
+        """
+        cached = await self.get(key)
+        if cached is None:
+            return None
+        etag, _, payload = cached.partition(b"\n")
+        return etag.decode(), payload
+
+    async def set_tagged(self, key: str, etag: str, payload: bytes, expire: int) -> None:
+        """Store payload and its ETag together under key with a TTL in seconds."""
+        await self.set(key, etag.encode() + b"\n" + payload, expire)
+
+    async def invalidate(self, namespace: str) -> None:
+        """Drop every cached response in a namespace."""
+        if self.redis is None:
+            return
+        try:
+            keys = [key async for key in self.redis.scan_iter(match=f"{self.prefix}:{namespace}:*")]
+            if keys:
+                await self.redis.delete(*keys)
+            logger.info(f"Invalidated {len(keys)} cached responses in namespace '{namespace}'")
+        except RedisError as e:
+            logger.warning(f"Cache invalidation failed for namespace '{namespace}': {e}")
+
+
+response_cache = ResponseCache()
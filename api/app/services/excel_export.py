@@ -1,82 +1,152 @@
 """Service for generating Excel exports of regulation requirements."""
-from io import BytesIO
-from typing import List, Dict, Any, Optional
-from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
-from openpyxl.utils import get_column_letter
+from contextlib import suppress
+from functools import lru_cache
+from itertools import chain
+from tempfile import SpooledTemporaryFile
+from typing import AsyncIterable, BinaryIO, Dict, Iterable, Mapping, Any
+from xlsxwriter import Workbook
+from xlsxwriter.format import Format
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime
+import re
 
+# Generated workbooks larger than this are spooled to a temporary file instead of memory
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
 
-def create_regulation_worksheet(workbook: Workbook, regulation: Dict[str, Any]) -> None:
-    """Create a worksheet for a single regulation."""
-    # Create worksheet with sanitized name (Excel sheet names have restrictions)
-    sheet_name = regulation.get('friendly_name', 'Unnamed Regulation')[:31]  # Max 31 chars
-    # Remove invalid characters
-    invalid_chars = ['\\', '/', '?', '*', '[', ']', ':']
-    for char in invalid_chars:
-        sheet_name = sheet_name.replace(char, '_')
+# constant_memory flushes each row as soon as the next one starts, so memory stays
+# flat however many regulations are exported. Strings are written as-is: no URL
+# or formula detection on Twilio-provided text.
+WORKBOOK_OPTIONS = {
+    'constant_memory': True,
+    'strings_to_urls': False,
+    'strings_to_formulas': False,
+    'use_zip64': True,
+}
+
+# Characters Excel does not allow in sheet names
+_SHEET_INVALID = re.compile(r'[\\/?*\[\]:]')
+# Excel also rejects names that begin or end with an apostrophe
+_SHEET_EDGE_APOSTROPHE = re.compile(r"^'|'$")
+_SHEET_NAME_MAX = 31
+
+# Cell format properties. xlsxwriter formats belong to a workbook, so these are
+# turned into Format objects once per workbook by _add_formats.
+_LEFT_CENTER = {'align': 'left', 'valign': 'vcenter'}
+_LEFT_CENTER_WRAP = {'align': 'left', 'valign': 'vcenter', 'text_wrap': True}
+_LEFT_TOP_WRAP = {'align': 'left', 'valign': 'top', 'text_wrap': True}
+_THIN_BORDER = {'border': 1}
+_ALT_ROW_FILL = {'bg_color': '#F2F2F2'}
+
+_HEADER = {'bold': True, 'font_size': 12, 'font_color': '#FFFFFF', 'bg_color': '#366092', **_LEFT_CENTER}
+_FIELD_NAME = {'font_size': 10, **_LEFT_TOP_WRAP, **_THIN_BORDER}
+_DESCRIPTION = {'font_size': 9, 'italic': True, **_LEFT_TOP_WRAP, **_THIN_BORDER}
+_VALUE = {'font_size': 10, **_LEFT_TOP_WRAP, **_THIN_BORDER}
+
+FORMAT_PROPERTIES = {
+    'header': _HEADER,
+    'table_header': {**_HEADER, **_THIN_BORDER},
+    'info': {'font_size': 10, **_LEFT_CENTER},
+    'updated': {'font_size': 9, 'italic': True, **_LEFT_CENTER},
+    'section': {'bold': True, 'font_size': 11, 'bg_color': '#D9E1F2', **_LEFT_CENTER, **_THIN_BORDER},
+    'field_name': _FIELD_NAME,
+    'field_name_alt': {**_FIELD_NAME, **_ALT_ROW_FILL},
+    'description': _DESCRIPTION,
+    'description_alt': {**_DESCRIPTION, **_ALT_ROW_FILL},
+    'value': _VALUE,
+    'value_alt': {**_VALUE, **_ALT_ROW_FILL},
+    'doc_name': {'bold': True, 'font_size': 11, 'bg_color': '#E7E6E6', **_LEFT_CENTER, **_THIN_BORDER},
+    'doc_description': {'font_size': 9, 'italic': True, **_LEFT_CENTER_WRAP},
+    'instruction': {'bold': True, 'font_size': 10, 'italic': True, 'bg_color': '#FFF2CC', **_LEFT_CENTER, **_THIN_BORDER},
+    'doc_type': {'bold': True, 'font_size': 10, **_LEFT_CENTER},
+    'subheader': {'bold': True, 'font_size': 9, **_ALT_ROW_FILL, **_LEFT_CENTER, **_THIN_BORDER},
+    'no_fields': {'font_size': 9, 'italic': True, **_LEFT_CENTER},
+}
+
+
+@lru_cache(maxsize=4096)
+def _sheet_title(friendly_name: str) -> str:
+    """Truncate a regulation name to Excel's 31 character limit and replace invalid characters."""
+    title = _SHEET_INVALID.sub('_', friendly_name[:_SHEET_NAME_MAX])
+    # Checked after truncating, which can leave an apostrophe at the end
+    return _SHEET_EDGE_APOSTROPHE.sub('_', title)
+
+
+def _add_formats(workbook: Workbook) -> Dict[str, Format]:
+    """Create the cell formats used by the regulation worksheets."""
+    return {name: workbook.add_format(properties) for name, properties in FORMAT_PROPERTIES.items()}
+
+
+def _unique_sheet_title(workbook: Workbook, title: str) -> str:
+    """Number a sheet title if the workbook already has one with that name (Excel names are case-insensitive)."""
+    existing = {name.lower() for name in workbook.sheetnames}
+    unique_title = title
+    suffix = 1
+    while unique_title.lower() in existing:
+        suffix_str = str(suffix)
+        unique_title = f"{title[:_SHEET_NAME_MAX - len(suffix_str)]}{suffix_str}"
+        suffix += 1
+    return unique_title
+
+
+def create_regulation_worksheet(workbook: Workbook, formats: Dict[str, Format], regulation: Mapping[str, Any]) -> None:
+    """
+    Create a worksheet for a single regulation.
+    
+    The workbook is in constant_memory mode, so rows must be written top to
+    bottom; each row is flushed to disk once the next one is started.
     
-    ws = workbook.create_sheet(title=sheet_name)
+    Args:
+        workbook: Workbook to add the worksheet to
+        formats: Cell formats created for this workbook by _add_formats
+        regulation: Regulation mapping with all required fields
+    """
+    friendly_name = regulation.get('friendly_name', 'Unnamed Regulation')
     
-    # Styles
-    header_font = Font(bold=True, size=12)
-    section_font = Font(bold=True, size=11)
-    field_name_font = Font(bold=False, size=10)
-    description_font = Font(size=9, italic=True)
+    # Create worksheet with sanitized name (Excel sheet names have restrictions)
+    ws = workbook.add_worksheet(_unique_sheet_title(workbook, _sheet_title(friendly_name)))
     
-    header_fill = PatternFill(start_color="366092", end_color="366092", fill_type="solid")
-    section_fill = PatternFill(start_color="D9E1F2", end_color="D9E1F2", fill_type="solid")
-    alt_row_fill = PatternFill(start_color="F2F2F2", end_color="F2F2F2", fill_type="solid")
+    # Column widths
+    ws.set_column(0, 0, 35)
+    ws.set_column(1, 1, 50)
+    ws.set_column(2, 2, 30)
     
-    header_font_white = Font(bold=True, size=12, color="FFFFFF")
+    # Freeze header row (first 3 rows are header info)
+    ws.freeze_panes(3, 0)
     
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
+    row = 0
     
-    row = 1
+    def write_merged(value, cell_format):
+        # Single value spanning columns A:C
+        nonlocal row
+        ws.merge_range(row, 0, row, 2, value, cell_format)
+        row += 1
     
     # Header Section
-    ws.merge_cells(f'A{row}:C{row}')
-    header_cell = ws[f'A{row}']
-    header_cell.value = regulation.get('friendly_name', 'Unnamed Regulation')
-    header_cell.font = header_font_white
-    header_cell.fill = header_fill
-    header_cell.alignment = Alignment(horizontal='left', vertical='center')
-    row += 1
+    write_merged(friendly_name, formats['header'])
     
     # Country, Number Type, End User Type
-    ws.merge_cells(f'A{row}:C{row}')
-    info_cell = ws[f'A{row}']
-    info_parts = []
-    if regulation.get('iso_country'):
-        info_parts.append(f"Country: {regulation['iso_country']}")
-    if regulation.get('number_type'):
-        info_parts.append(f"Number Type: {regulation['number_type']}")
-    if regulation.get('end_user_type'):
-        info_parts.append(f"End User Type: {regulation['end_user_type']}")
-    info_cell.value = " | ".join(info_parts) if info_parts else "Regulation Information"
-    info_cell.font = Font(size=10)
-    info_cell.alignment = Alignment(horizontal='left', vertical='center')
-    row += 1
+    iso_country = regulation.get('iso_country')
+    number_type = regulation.get('number_type')
+    end_user_type = regulation.get('end_user_type')
+    info_parts = [part for part in (
+        f"Country: {iso_country}" if iso_country else None,
+        f"Number Type: {number_type}" if number_type else None,
+        f"End User Type: {end_user_type}" if end_user_type else None,
+    ) if part]
+    info = " | ".join(info_parts) if info_parts else "Regulation Information"
+    write_merged(info, formats['info'])
     
     # Last Updated
-    ws.merge_cells(f'A{row}:C{row}')
-    updated_cell = ws[f'A{row}']
     last_updated = regulation.get('last_updated')
     if last_updated:
         if isinstance(last_updated, str):
-            updated_cell.value = f"Last Updated: {last_updated}"
+            updated = f"Last Updated: {last_updated}"
         else:
-            updated_cell.value = f"Last Updated: {last_updated.strftime('%Y-%m-%d %H:%M:%S')}"
+            updated = f"Last Updated: {last_updated.strftime('%Y-%m-%d %H:%M:%S')}"
     else:
-        updated_cell.value = "Last Updated: N/A"
-    updated_cell.font = Font(size=9, italic=True)
-    updated_cell.alignment = Alignment(horizontal='left', vertical='center')
-    row += 2
+        updated = "Last Updated: N/A"
+    write_merged(updated, formats['updated'])
+    row += 1
     
     requirements = regulation.get('requirements', {})
     
@@ -84,49 +154,25 @@ def create_regulation_worksheet(workbook: Workbook, regulation: Dict[str, Any])
     end_user_reqs = requirements.get('end_user', [])
     if end_user_reqs:
         # Section Header
-        ws.merge_cells(f'A{row}:C{row}')
-        section_cell = ws[f'A{row}']
-        section_cell.value = "Required Information"
-        section_cell.font = section_font
-        section_cell.fill = section_fill
-        section_cell.alignment = Alignment(horizontal='left', vertical='center')
-        section_cell.border = thin_border
-        row += 1
+        write_merged("Required Information", formats['section'])
         
         # Table Header
-        ws[f'A{row}'] = "Field Name"
-        ws[f'B{row}'] = "Description"
-        ws[f'C{row}'] = "Value"
-        for col in ['A', 'B', 'C']:
-            cell = ws[f'{col}{row}']
-            cell.font = header_font
-            cell.fill = header_fill
-            cell.font = header_font_white
-            cell.alignment = Alignment(horizontal='left', vertical='center')
-            cell.border = thin_border
+        ws.write_row(row, 0, ("Field Name", "Description", "Value"), formats['table_header'])
         row += 1
         
         # Process each end user requirement
         for end_user_req in end_user_reqs:
             detailed_fields = end_user_req.get('detailed_fields', [])
             for idx, field in enumerate(detailed_fields):
-                ws[f'A{row}'] = field.get('friendly_name', field.get('machine_name', ''))
-                ws[f'B{row}'] = field.get('description', '')
-                ws[f'C{row}'] = ""  # Empty value column for user input
-                
-                # Apply styling
-                for col in ['A', 'B', 'C']:
-                    cell = ws[f'{col}{row}']
-                    cell.border = thin_border
-                    if idx % 2 == 1:  # Alternate row colors
-                        cell.fill = alt_row_fill
-                    if col == 'A':
-                        cell.font = field_name_font
-                    elif col == 'B':
-                        cell.font = description_font
-                    else:
-                        cell.font = Font(size=10)
-                    cell.alignment = Alignment(horizontal='left', vertical='top', wrap_text=True)
+                # machine_name is only looked up when there is no friendly name
+                field_name = field.get('friendly_name') or field.get('machine_name') or ''
+                description = field.get('description', '')
+                # Alternate row colors
+                alt = '_alt' if idx % 2 == 1 else ''
+                ws.write_string(row, 0, field_name, formats['field_name' + alt])
+                ws.write(row, 1, description, formats['description' + alt])
+                # Empty value column for user input
+                ws.write_blank(row, 2, None, formats['value' + alt])
                 row += 1
         
         row += 1
@@ -134,134 +180,122 @@ def create_regulation_worksheet(workbook: Workbook, regulation: Dict[str, Any])
     # Supporting Document Requirements Section
     supporting_docs = requirements.get('supporting_document', [])
     if supporting_docs:
-        # Flatten nested arrays
-        flattened_docs = []
-        for doc_group in supporting_docs:
-            if isinstance(doc_group, list):
-                flattened_docs.extend(doc_group)
-            else:
-                flattened_docs.append(doc_group)
+        # Flatten nested arrays (Twilio groups alternative documents in inner lists)
+        flattened_docs = list(chain.from_iterable(
+            doc_group if isinstance(doc_group, list) else (doc_group,)
+            for doc_group in supporting_docs
+        ))
         
         if flattened_docs:
             # Section Header
-            ws.merge_cells(f'A{row}:C{row}')
-            section_cell = ws[f'A{row}']
-            section_cell.value = "Required Documents"
-            section_cell.font = section_font
-            section_cell.fill = section_fill
-            section_cell.alignment = Alignment(horizontal='left', vertical='center')
-            section_cell.border = thin_border
-            row += 1
+            write_merged("Required Documents", formats['section'])
             
             # Process each document requirement
             for doc_req in flattened_docs:
                 # Document Name
-                ws.merge_cells(f'A{row}:C{row}')
-                doc_name_cell = ws[f'A{row}']
-                doc_name_cell.value = doc_req.get('name', 'Document Requirement')
-                doc_name_cell.font = Font(bold=True, size=11)
-                doc_name_cell.fill = PatternFill(start_color="E7E6E6", end_color="E7E6E6", fill_type="solid")
-                doc_name_cell.alignment = Alignment(horizontal='left', vertical='center')
-                doc_name_cell.border = thin_border
-                row += 1
+                write_merged(doc_req.get('name', 'Document Requirement'), formats['doc_name'])
                 
                 # Description
-                if doc_req.get('description'):
-                    ws.merge_cells(f'A{row}:C{row}')
-                    desc_cell = ws[f'A{row}']
-                    desc_cell.value = doc_req.get('description')
-                    desc_cell.font = Font(size=9, italic=True)
-                    desc_cell.alignment = Alignment(horizontal='left', vertical='center', wrap_text=True)
-                    row += 1
+                doc_description = doc_req.get('description')
+                if doc_description:
+                    write_merged(doc_description, formats['doc_description'])
                 
                 # Accepted Documents
                 accepted_docs = doc_req.get('accepted_documents', [])
                 if accepted_docs:
                     # Add instruction if multiple document types are accepted
                     if len(accepted_docs) > 1:
-                        ws.merge_cells(f'A{row}:C{row}')
-                        instruction_cell = ws[f'A{row}']
-                        instruction_cell.value = "Choose ONE of the following document types:"
-                        instruction_cell.font = Font(bold=True, size=10, italic=True)
-                        instruction_cell.fill = PatternFill(start_color="FFF2CC", end_color="FFF2CC", fill_type="solid")
-                        instruction_cell.alignment = Alignment(horizontal='left', vertical='center')
-                        instruction_cell.border = thin_border
-                        row += 1
+                        write_merged("Choose ONE of the following document types:", formats['instruction'])
                     
                     for accepted_doc in accepted_docs:
                         # Document Type Name
-                        ws.merge_cells(f'A{row}:C{row}')
-                        doc_type_cell = ws[f'A{row}']
-                        doc_type_cell.value = f"  Accepted: {accepted_doc.get('name', 'Document')}"
-                        doc_type_cell.font = Font(bold=True, size=10)
-                        doc_type_cell.alignment = Alignment(horizontal='left', vertical='center')
-                        row += 1
+                        write_merged(f"  Accepted: {accepted_doc.get('name', 'Document')}", formats['doc_type'])
                         
                         # Fields for this document type
                         detailed_fields = accepted_doc.get('detailed_fields', [])
                         if detailed_fields:
                             # Sub-header for fields - only Field Name column
-                            ws[f'A{row}'] = "Field Name"
-                            cell = ws[f'A{row}']
-                            cell.font = Font(bold=True, size=9)
-                            cell.fill = PatternFill(start_color="F2F2F2", end_color="F2F2F2", fill_type="solid")
-                            cell.alignment = Alignment(horizontal='left', vertical='center')
-                            cell.border = thin_border
+                            ws.write_string(row, 0, "Field Name", formats['subheader'])
                             row += 1
                             
                             # Field rows - only Field Name column
                             for idx, field in enumerate(detailed_fields):
-                                ws[f'A{row}'] = field.get('friendly_name', field.get('machine_name', ''))
-                                
-                                cell = ws[f'A{row}']
-                                cell.border = thin_border
-                                if idx % 2 == 1:
-                                    cell.fill = alt_row_fill
-                                cell.font = field_name_font
-                                cell.alignment = Alignment(horizontal='left', vertical='top', wrap_text=True)
+                                field_name = field.get('friendly_name') or field.get('machine_name') or ''
+                                ws.write_string(row, 0, field_name,
+                                                formats['field_name_alt' if idx % 2 == 1 else 'field_name'])
                                 row += 1
                         else:
                             # No specific fields, just document type
-                            ws.merge_cells(f'A{row}:C{row}')
-                            no_fields_cell = ws[f'A{row}']
-                            no_fields_cell.value = "  (No specific fields required)"
-                            no_fields_cell.font = Font(size=9, italic=True)
-                            no_fields_cell.alignment = Alignment(horizontal='left', vertical='center')
-                            row += 1
+                            write_merged("  (No specific fields required)", formats['no_fields'])
                 
                 row += 1  # Space between document requirements
-    
-    # Auto-adjust column widths
-    ws.column_dimensions['A'].width = 35
-    ws.column_dimensions['B'].width = 50
-    ws.column_dimensions['C'].width = 30
-    
-    # Freeze header row (first 3 rows are header info)
-    ws.freeze_panes = 'A4'
 
 
-def generate_regulation_excel(regulations: List[Dict[str, Any]]) -> BytesIO:
+def _new_workbook() -> tuple[Workbook, Dict[str, Format], BinaryIO]:
+    """Create an empty workbook writing to a spooled temporary file, with its cell formats."""
+    output = SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    workbook = Workbook(output, WORKBOOK_OPTIONS)
+    return workbook, _add_formats(workbook), output
+
+
+def _close_workbook(workbook: Workbook, output: BinaryIO) -> BinaryIO:
+    """Finish writing a workbook and rewind its output file for reading."""
+    workbook.close()
+    output.seek(0)
+    return output
+
+
+def _discard_workbook(workbook: Workbook, output: BinaryIO) -> None:
+    """Close a partly built workbook and its output file after a failure."""
+    # close() also removes the temporary file constant_memory keeps per worksheet
+    with suppress(Exception):
+        workbook.close()
+    output.close()
+
+
+def generate_regulation_excel(regulations: Iterable[Mapping[str, Any]]) -> BinaryIO:
     """Generate an Excel workbook from one or more regulations.
     
     Args:
-        regulations: List of regulation dictionaries with all required fields
+        regulations: Regulation mappings (dicts or database row mappings) with all required fields
         
     Returns:
-        BytesIO object containing the Excel file
+        Spooled temporary file containing the Excel file (caller closes it)
     """
-    workbook = Workbook()
-    # Remove default sheet
-    if 'Sheet' in workbook.sheetnames:
-        workbook.remove(workbook['Sheet'])
-    
-    # Create a worksheet for each regulation
-    for regulation in regulations:
-        create_regulation_worksheet(workbook, regulation)
+    workbook, formats, output = _new_workbook()
+    try:
+        # Create a worksheet for each regulation
+        for regulation in regulations:
+            create_regulation_worksheet(workbook, formats, regulation)
+        
+        return _close_workbook(workbook, output)
+    except BaseException:
+        _discard_workbook(workbook, output)
+        raise
+
+
+async def generate_regulation_excel_from_stream(regulations: AsyncIterable[Mapping[str, Any]]) -> BinaryIO:
+    """Generate an Excel workbook from regulations as they arrive from a database stream.
     
-    # Save to BytesIO
-    output = BytesIO()
-    workbook.save(output)
-    output.seek(0)
+    Each regulation is written to its worksheet as soon as it is received, so the
+    source rows never need to be held in memory together. Worksheet building and
+    the final save are CPU-bound and run in the thread pool to keep the event
+    loop responsive.
     
-    return output
-
+    Args:
+        regulations: Async iterable of regulation mappings with all required fields
+        
+    Returns:
+        Spooled temporary file containing the Excel file (caller closes it)
+    """
+    workbook, formats, output = _new_workbook()
+    try:
+        # Create a worksheet for each regulation as it is streamed in
+        async for regulation in regulations:
+            await run_in_threadpool(create_regulation_worksheet, workbook, formats, regulation)
+        
+        return await run_in_threadpool(_close_workbook, workbook, output)
+    except BaseException:
+        # Discarded inline: on cancellation a thread pool hand-off could be cancelled too
+        _discard_workbook(workbook, output)
+        raise
@@ -1,13 +1,34 @@
 """Async Twilio API client with retry logic and rate limiting."""
 import httpx
+import orjson
 import asyncio
-import base64
-from typing import List, Dict, Optional, Any
+import random
+import time
+from functools import lru_cache
+from typing import AsyncIterator, Callable, List, Dict, Optional, Any, Tuple
 from datetime import datetime
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Sync jobs fan out over api.twilio.com and numbers.twilio.com, so keep plenty of
+# idle connections per host for reuse between requests
+HTTP_LIMITS = httpx.Limits(max_keepalive_connections=50, max_connections=200, keepalive_expiry=30.0)
+
+# Number types reported per country, in column order (subresource_uris keys)
+NUMBER_TYPES = (
+    "local",
+    "toll_free",
+    "mobile",
+    "national",
+    "voip",
+    "shared_cost",
+    "machine_to_machine",
+)
+
+# The country list rarely changes, so back-to-back syncs reuse one fetch
+COUNTRIES_CACHE_TTL_SECONDS = 60 * 60
+
 
 class TwilioAPIError(Exception):
     """Base exception for Twilio API errors."""
@@ -19,13 +40,99 @@ class TwilioRateLimitError(TwilioAPIError):
     pass
 
 
+class AdaptiveRateLimiter:
+    """
+    Token bucket whose rate adapts to Twilio throttling (AIMD).
+    
+    A 429 halves the rate at most once per `throttle_cooldown` seconds: the
+    requests already in flight when Twilio starts throttling all come back 429,
+    and they describe one throttling event rather than one each. The rate
+    grows back by one request per second after each run of `increase_after`
+    successful requests, up to max_rate.
+    """
+    
+    def __init__(
+        self,
+        max_rate: float,
+        min_rate: float = 1.0,
+        increase_after: int = 50,
+        throttle_cooldown: float = 60.0
+    ):
+        """
+        Initialize the limiter at its maximum rate.
+        
+        Args:
+            max_rate: Highest request rate in requests per second
+            min_rate: Lowest rate the limiter backs off to
+            increase_after: Consecutive successes before the rate steps back up
+            throttle_cooldown: Seconds after a decrease during which further 429s do not lower the rate again
+        """
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.increase_after = increase_after
+        self.throttle_cooldown = throttle_cooldown
+        self.rate = max_rate
+        self._throttled_until = 0.0
+        self._tokens = max_rate
+        self._updated = time.monotonic()
+        self._successes = 0
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self) -> None:
+        """Wait until a request may be sent (waiters are admitted in arrival order)."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.rate, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+    
+    def on_throttled(self) -> None:
+        """Halve the rate after a 429, unless it was already halved within the cooldown."""
+        self._successes = 0
+        now = time.monotonic()
+        if now < self._throttled_until:
+            return
+        self._throttled_until = now + self.throttle_cooldown
+        self.rate = max(self.min_rate, self.rate / 2)
+        self._tokens = min(self._tokens, self.rate)
+    
+    def on_success(self) -> None:
+        """Count a successful request, stepping the rate back up after enough of them."""
+        self._successes += 1
+        if self._successes >= self.increase_after:
+            self._successes = 0
+            self.rate = min(self.max_rate, self.rate + 1)
+
+
 class TwilioClient:
     """Async client for Twilio API with retry logic."""
     
     BASE_URL = "https://api.twilio.com"
     NUMBERS_BASE_URL = "https://numbers.twilio.com"
+    REGULATIONS_URL = NUMBERS_BASE_URL + "/v2/RegulatoryCompliance/Regulations"
+    
+    # search_available_numbers number type -> AvailablePhoneNumbers resource name
+    _TYPE_MAPPING = {
+        "mobile": "Mobile",
+        "local": "Local",
+        "toll-free": "TollFree",
+    }
     
-    def __init__(self, account_sid: str, auth_token: str, max_retries: int = 3):
+    def __init__(
+        self,
+        account_sid: str,
+        auth_token: str,
+        max_retries: int = 3,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+        jitter_factor: float = 0.2,
+        rng: Optional[random.Random] = None,
+        max_requests_per_second: float = 100.0
+    ):
         """
         Initialize Twilio client.
         
@@ -33,34 +140,49 @@ class TwilioClient:
             account_sid: Twilio Account SID
             auth_token: Twilio Auth Token
             max_retries: Maximum number of retry attempts
+            base_delay: Backoff delay in seconds before the first network error retry
+            max_delay: Upper bound in seconds for the network error backoff
+            jitter_factor: Fraction of Retry-After added as random delay on 429s
+            rng: Random number generator for backoff jitter (seed one for reproducible delays)
+            max_requests_per_second: Request rate ceiling (Twilio's default account limit is 100/s)
         """
         self.account_sid = account_sid
         self.auth_token = auth_token
         self.max_retries = max_retries
+        # Prefix of every AvailablePhoneNumbers URL for this account
+        self._available_numbers_url = f"{self.BASE_URL}/2010-04-01/Accounts/{account_sid}/AvailablePhoneNumbers"
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.jitter_factor = jitter_factor
+        self.rng = rng or random.Random()
+        self.rate_limiter = AdaptiveRateLimiter(max_requests_per_second)
         
-        # Create base64 encoded credentials for Basic Auth
-        credentials = f"{account_sid}:{auth_token}"
-        encoded_credentials = base64.b64encode(credentials.encode()).decode()
-        self.auth_header = f"Basic {encoded_credentials}"
+        # (expires_at, countries) from the last list_countries fetch
+        self._countries_cache: Optional[Tuple[float, List[Dict[str, Any]]]] = None
+        self._countries_lock = asyncio.Lock()
         
-        # Create httpx client with timeout
+        # Create httpx client with timeout. BasicAuth encodes the Authorization
+        # header once, here. The transport does no connect retries of its own,
+        # since _make_request already retries network errors.
         self.client = httpx.AsyncClient(
+            transport=httpx.AsyncHTTPTransport(http2=True, limits=HTTP_LIMITS, retries=0),
             timeout=httpx.Timeout(30.0),
-            headers={
-                "Authorization": self.auth_header,
-                "Accept": "application/json",
-            },
+            auth=httpx.BasicAuth(account_sid, auth_token),
+            headers={"Accept": "application/json"},
         )
     
     async def close(self):
         """Close the HTTP client."""
         await self.client.aclose()
     
+    def _backoff_delay(self, retry_count: int) -> float:
+        """Exponential backoff with full jitter: uniform(0, min(max_delay, base_delay * 2**retry_count))."""
+        return self.rng.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry_count))
+    
     async def _make_request(
         self,
         method: str,
         url: str,
-        retry_count: int = 0,
         **kwargs
     ) -> httpx.Response:
         """
@@ -69,7 +191,6 @@ class TwilioClient:
         Args:
             method: HTTP method
             url: Request URL
-            retry_count: Current retry attempt
             **kwargs: Additional arguments for httpx request
             
         Returns:
@@ -79,60 +200,127 @@ class TwilioClient:
             TwilioRateLimitError: If rate limited
             TwilioAPIError: For other API errors
         """
-        try:
-            response = await self.client.request(method, url, **kwargs)
+        for retry_count in range(self.max_retries + 1):
+            await self.rate_limiter.acquire()
+            try:
+                response = await self.client.request(method, url, **kwargs)
+            except httpx.RequestError as e:
+                # Retry on network errors
+                if retry_count == self.max_retries:
+                    raise TwilioAPIError(f"Request error after {self.max_retries} retries: {e}")
+                wait_time = self._backoff_delay(retry_count)
+                logger.warning(f"Request error on {method} {url} (attempt {retry_count + 1}): {e}. Retrying in {wait_time:.2f} seconds...")
+                await asyncio.sleep(wait_time)
+                continue
             
             # Handle rate limiting (429)
             if response.status_code == 429:
-                retry_after = int(response.headers.get("Retry-After", "60"))
-                logger.warning(f"Rate limited. Retrying after {retry_after} seconds...")
-                
-                if retry_count < self.max_retries:
-                    await asyncio.sleep(retry_after)
-                    return await self._make_request(method, url, retry_count + 1, **kwargs)
-                else:
+                self.rate_limiter.on_throttled()
+                if retry_count == self.max_retries:
                     raise TwilioRateLimitError(f"Rate limit exceeded after {self.max_retries} retries")
+                # Keep the server hint as the floor, jittered so throttled requests don't retry in lockstep
+                retry_after = int(response.headers.get("Retry-After", "60"))
+                wait_time = retry_after + self.rng.uniform(0, min(10.0, retry_after * self.jitter_factor))
+                logger.warning(f"Rate limited on {method} {url} (attempt {retry_count + 1}). Retrying in {wait_time:.2f} seconds...")
+                await asyncio.sleep(wait_time)
+                continue
             
-            # Handle other errors
-            response.raise_for_status()
+            # Server errors are transient: retry them like network errors
+            if response.status_code >= 500 and retry_count < self.max_retries:
+                wait_time = self._backoff_delay(retry_count)
+                logger.warning(f"Server error {response.status_code} on {method} {url} (attempt {retry_count + 1}). Retrying in {wait_time:.2f} seconds...")
+                await asyncio.sleep(wait_time)
+                continue
+            
+            # Other client errors (bad credentials, unknown country, ...) will not succeed on retry
+            try:
+                response.raise_for_status()
+            except httpx.HTTPStatusError as e:
+                raise TwilioAPIError(f"API error: {e}")
+            self.rate_limiter.on_success()
             return response
+    
+    async def _paginate(
+        self,
+        url: str,
+        next_page_url: Callable[[Dict[str, Any]], Optional[str]],
+        params: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Fetch and parse every page of a list resource.
+        
+        Twilio's next page links carry opaque page tokens, so a page can only be
+        requested once the previous one is parsed. The request for the next page
+        is started before the current page is handed to the caller, so the
+        caller's processing overlaps the next round trip.
+        
+        Args:
+            url: URL of the first page
+            next_page_url: Returns the absolute next page URL from a parsed page, or None on the last page
+            params: Query parameters for the first page (later page URLs already include them)
             
-        except httpx.HTTPStatusError as e:
-            if e.response.status_code == 429:
-                raise TwilioRateLimitError(f"Rate limit error: {e}")
-            raise TwilioAPIError(f"API error: {e}")
-        except httpx.RequestError as e:
-            # Retry on network errors
-            if retry_count < self.max_retries:
-                wait_time = 2 ** retry_count  # Exponential backoff
-                logger.warning(f"Request error, retrying in {wait_time} seconds...")
-                await asyncio.sleep(wait_time)
-                return await self._make_request(method, url, retry_count + 1, **kwargs)
-            raise TwilioAPIError(f"Request error after {self.max_retries} retries: {e}")
+        Yields:
+            Parsed page dictionaries
+            
+        Raises:
+            TwilioRateLimitError: If rate limited
+            TwilioAPIError: For other API errors
+        """
+        next_request = asyncio.ensure_future(self._make_request("GET", url, params=params))
+        try:
+            while next_request is not None:
+                response = await next_request
+                if logger.isEnabledFor(logging.DEBUG):
+                    # Body size only; the body is never decoded to text for logging
+                    logger.debug(f"Fetched page {response.url}: {len(response.content)} bytes")
+                data = orjson.loads(response.content)
+                url = next_page_url(data)
+                next_request = asyncio.ensure_future(self._make_request("GET", url)) if url else None
+                yield data
+        finally:
+            # The caller stopped early or a page failed: drop the prefetched request,
+            # retrieving its error if it already finished so it is not reported as unhandled
+            if next_request is not None and not next_request.cancel() and not next_request.cancelled():
+                next_request.exception()
+    
+    def _api_next_page_url(self, data: Dict[str, Any]) -> Optional[str]:
+        """Next page URL of an api.twilio.com list response (next_page_uri is host-relative)."""
+        next_page_uri = data.get("next_page_uri")
+        return self.BASE_URL + next_page_uri if next_page_uri else None
+    
+    @staticmethod
+    def _numbers_next_page_url(data: Dict[str, Any]) -> Optional[str]:
+        """Next page URL of a numbers.twilio.com list response."""
+        return data.get("meta", {}).get("next_page_url")
     
-    async def list_countries(self) -> List[Dict[str, Any]]:
+    async def list_countries(self, force_refresh: bool = False) -> List[Dict[str, Any]]:
         """
         Fetch all countries with available phone numbers.
-        Handles pagination automatically.
+        Handles pagination automatically. Results are cached on the client for
+        COUNTRIES_CACHE_TTL_SECONDS.
+        
+        Args:
+            force_refresh: Fetch from Twilio even if a cached list is available
         
         Returns:
             List of country dictionaries
         """
-        url = f"{self.BASE_URL}/2010-04-01/Accounts/{self.account_sid}/AvailablePhoneNumbers.json"
-        all_countries = []
-        
-        while url:
-            response = await self._make_request("GET", url)
-            data = response.json()
+        # Concurrent callers wait for a single fetch
+        async with self._countries_lock:
+            if not force_refresh and self._countries_cache is not None:
+                expires_at, countries = self._countries_cache
+                if expires_at > time.monotonic():
+                    return list(countries)
             
-            # Extract countries from response
-            countries = data.get("countries", [])
-            all_countries.extend(countries)
-            
-            # Check for next page
-            url = data.get("next_page_uri")
-            if url:
-                url = f"{self.BASE_URL}{url}"
+            countries = await self._fetch_countries()
+            self._countries_cache = (time.monotonic() + COUNTRIES_CACHE_TTL_SECONDS, countries)
+            return list(countries)
+    
+    async def _fetch_countries(self) -> List[Dict[str, Any]]:
+        """Fetch every page of the available phone numbers country list."""
+        all_countries = []
+        async for data in self._paginate(self._available_numbers_url + ".json", self._api_next_page_url):
+            all_countries.extend(data.get("countries", []))
         
         logger.info(f"Fetched {len(all_countries)} countries")
         return all_countries
@@ -147,10 +335,10 @@ class TwilioClient:
         Returns:
             Country details dictionary with subresource_uris
         """
-        url = f"{self.BASE_URL}/2010-04-01/Accounts/{self.account_sid}/AvailablePhoneNumbers/{country_code}.json"
+        url = self._available_numbers_url + "/" + country_code + ".json"
         
         response = await self._make_request("GET", url)
-        data = response.json()
+        data = orjson.loads(response.content)
         
         return data
     
@@ -166,15 +354,23 @@ class TwilioClient:
         """
         subresource_uris = country_data.get("subresource_uris", {})
         
-        return {
-            "local": "local" in subresource_uris,
-            "toll_free": "toll_free" in subresource_uris,
-            "mobile": "mobile" in subresource_uris,
-            "national": "national" in subresource_uris,
-            "voip": "voip" in subresource_uris,
-            "shared_cost": "shared_cost" in subresource_uris,
-            "machine_to_machine": "machine_to_machine" in subresource_uris,
+        return {number_type: number_type in subresource_uris for number_type in NUMBER_TYPES}
+    
+    @staticmethod
+    @lru_cache(maxsize=1024)
+    def _regulations_url(country_code: str, number_type: Optional[str], include_constraints: bool) -> str:
+        """First page URL of the regulations list, with its query string built once per filter combination."""
+        # Build query parameters
+        params = {
+            "EndUserType": "business",  # Always set to business
+            "IsoCountry": country_code,
+            "IncludeConstraints": str(include_constraints).lower(),
         }
+        
+        if number_type:
+            params["NumberType"] = number_type
+        
+        return str(httpx.URL(TwilioClient.REGULATIONS_URL, params=params))
     
     async def list_regulations(
         self,
@@ -195,39 +391,12 @@ class TwilioClient:
         Returns:
             List of regulation dictionaries
         """
-        # Use the numbers.twilio.com domain for regulatory compliance API
-        base_url = "https://numbers.twilio.com"
-        url = f"{base_url}/v2/RegulatoryCompliance/Regulations"
-        
-        # Build query parameters
-        params = {
-            "EndUserType": "business",  # Always set to business
-            "IsoCountry": country_code,
-            "IncludeConstraints": str(include_constraints).lower(),
-        }
-        
-        if number_type:
-            params["NumberType"] = number_type
-        
+        # Use the numbers.twilio.com domain for regulatory compliance API.
+        # Later page URLs from meta.next_page_url already carry the query.
+        url = self._regulations_url(country_code, number_type, include_constraints)
         all_regulations = []
-        
-        while url:
-            # Make request with current URL and params
-            response = await self._make_request("GET", url, params=params)
-            data = response.json()
-            
-            # Extract regulations from response
-            regulations = data.get("results", [])
-            all_regulations.extend(regulations)
-            
-            # Check for next page
-            next_page_url = data.get("meta", {}).get("next_page_url")
-            if next_page_url:
-                url = next_page_url
-                # Clear params for subsequent requests (they're in the URL)
-                params = {}
-            else:
-                url = None
+        async for data in self._paginate(url, self._numbers_next_page_url):
+            all_regulations.extend(data.get("results", []))
         
         logger.info(f"Fetched {len(all_regulations)} regulations for country {country_code}")
         return all_regulations
@@ -256,19 +425,13 @@ class TwilioClient:
             TwilioAPIError: If number_type is invalid or API error occurs
         """
         # Map number type to Twilio API path format
-        type_mapping = {
-            "mobile": "Mobile",
-            "local": "Local",
-            "toll-free": "TollFree"
-        }
-        
-        if number_type not in type_mapping:
+        twilio_type = self._TYPE_MAPPING.get(number_type)
+        if twilio_type is None:
             raise TwilioAPIError(
-                f"Invalid number type: {number_type}. Must be one of: {', '.join(type_mapping.keys())}"
+                f"Invalid number type: {number_type}. Must be one of: {', '.join(self._TYPE_MAPPING)}"
             )
         
-        twilio_type = type_mapping[number_type]
-        url = f"{self.BASE_URL}/2010-04-01/Accounts/{self.account_sid}/AvailablePhoneNumbers/{country_code}/{twilio_type}.json"
+        url = self._available_numbers_url + "/" + country_code + "/" + twilio_type + ".json"
         
         # Build query parameters
         # httpx will convert boolean values to "true"/"false" strings in query params
@@ -283,51 +446,20 @@ class TwilioClient:
         logger.debug(f"Request URL: {url}")
         
         all_numbers = []
-        
-        while url:
-            # Make request with current URL and params
-            response = await self._make_request("GET", url, params=params)
-            
-            # Log raw response for debugging
-            raw_text = response.text
-            logger.debug(f"Raw response (first 500 chars): {raw_text[:500]}")
-            
-            data = response.json()
-            
-            # Log response structure for debugging
-            logger.debug(f"Response keys: {list(data.keys())}")
-            logger.debug(f"Response status: {response.status_code}")
-            
+        async for data in self._paginate(url, self._api_next_page_url, params):
             # Extract available numbers from response
             numbers = data.get("available_phone_numbers", [])
             
-            # Log detailed response info
-            logger.info(f"Response contains {len(numbers)} numbers")
-            if numbers:
-                logger.info(f"First number example: {numbers[0] if numbers else 'N/A'}")
-            else:
-                # Log full response when empty to debug
-                logger.warning(f"No numbers found. Response keys: {list(data.keys())}")
-                # Log the actual value of available_phone_numbers
-                if "available_phone_numbers" in data:
-                    av_nums = data["available_phone_numbers"]
-                    logger.warning(f"available_phone_numbers type: {type(av_nums)}, value: {av_nums}")
-                # Log full response structure
-                import json
-                logger.warning(f"Full response JSON: {json.dumps(data, indent=2)[:2000]}")
-                # Check pagination info
-                logger.info(f"Page info - page: {data.get('page')}, page_size: {data.get('page_size')}, end: {data.get('end')}, start: {data.get('start')}")
+            # Only small fields are logged: the body itself can be large and is never serialized for logs
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(f"Page contains {len(numbers)} numbers, keys: {list(data)}")
+            if not numbers:
+                logger.warning(
+                    f"No numbers found. Response keys: {list(data)}, page: {data.get('page')}, "
+                    f"page_size: {data.get('page_size')}, start: {data.get('start')}, end: {data.get('end')}"
+                )
             
             all_numbers.extend(numbers)
-            
-            # Check for next page
-            next_page_uri = data.get("next_page_uri")
-            if next_page_uri:
-                url = f"{self.BASE_URL}{next_page_uri}"
-                # Clear params for subsequent requests (they're in the URL)
-                params = {}
-            else:
-                url = None
         
         logger.info(f"Fetched {len(all_numbers)} available {number_type} numbers for country {country_code}")
         return all_numbers
@@ -1,122 +1,287 @@
 """Background task for syncing Twilio number types and regulations."""
 import asyncio
-import uuid
+from contextlib import aclosing
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Dict, Optional, List
+from itertools import islice
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Optional, List, TypeVar
+from redis.asyncio import Redis
+import ulid
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import func
 from sqlalchemy.dialects.postgresql import insert
 
-from app.services.twilio_client import TwilioClient
+from app.services.twilio_client import NUMBER_TYPES, TwilioClient
 from app.models import CountryNumberTypes, Regulation
 from app.schemas import CountryNumberTypesCreate
 import logging
 
 logger = logging.getLogger(__name__)
 
-# In-memory storage for sync job status (in production, use Redis or database)
-sync_jobs: Dict[str, Dict] = {}
+# Sync job status is kept in Redis so it is shared by the API processes and the
+# worker: one hash per job, plus a sorted set of job IDs scored by creation time
+SYNC_JOB_KEY_PREFIX = "sync:job:"
+SYNC_JOBS_INDEX_KEY = "sync:jobs"
+
+# Job statuses expire a day after the job is created, and leave the index with them
+SYNC_JOB_TTL_SECONDS = 24 * 60 * 60
+
+# Countries fetched per batch; each batch is handed on for upsert as soon as it is ready
+SYNC_BATCH_SIZE = 32
+
+# Twilio requests kept in flight per sync
+SYNC_CONCURRENCY = 10
+
+# Rows per INSERT ... ON CONFLICT statement (keeps each statement well under
+# asyncpg's 32767 bind parameter limit)
+UPSERT_CHUNK_SIZE = 500
+
+# Columns written by the upserts, conflict key first (the rest are updated on conflict)
+COUNTRY_COLUMNS = ("country_code", "country", "beta", *NUMBER_TYPES)
+REGULATION_COLUMNS = (
+    "sid",
+    "friendly_name",
+    "iso_country",
+    "number_type",
+    "end_user_type",
+    "requirements",
+    "url",
+)
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+@dataclass(slots=True)
+class SyncJobState:
+    """Status of a sync job as stored in Redis."""
+    job_id: str
+    status: str
+    started_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
+    countries_processed: int = 0
+    countries_total: Optional[int] = None
+    error: Optional[str] = None
+
+
+def new_sync_job_id() -> str:
+    """
+    Generate a sync job ID.
+    
+    Job IDs are ULIDs: the leading 48 bits are the creation time in
+    milliseconds, so IDs sort by creation time and the index score can be
+    read back from the ID itself.
+    
+    Returns:
+        26 character Crockford base32 ULID string
+    """
+    return ulid.new().str
+
+
+def _job_score(job_id: str) -> float:
+    """Index score of a job: its ULID creation time in seconds (ValueError if not a ULID)."""
+    return ulid.parse(job_id).timestamp().timestamp
+
+
+def _job_key(job_id: str) -> str:
+    return f"{SYNC_JOB_KEY_PREFIX}{job_id}"
+
+
+def _encode_job_fields(fields: Dict[str, Any]) -> Dict[str, str]:
+    """Encode job fields as hash values (None values are left unset)."""
+    return {
+        key: value.isoformat() if isinstance(value, datetime) else str(value)
+        for key, value in fields.items()
+        if value is not None
+    }
+
+
+def _decode_job(job_id: str, raw: Dict[bytes, bytes]) -> SyncJobState:
+    """Decode a job hash into a SyncJobState."""
+    job = {key.decode(): value.decode() for key, value in raw.items()}
+    started_at = job.get("started_at")
+    completed_at = job.get("completed_at")
+    countries_total = job.get("countries_total")
+    return SyncJobState(
+        job_id=job_id,
+        status=job["status"],
+        started_at=datetime.fromisoformat(started_at) if started_at else None,
+        completed_at=datetime.fromisoformat(completed_at) if completed_at else None,
+        countries_processed=int(job.get("countries_processed", 0)),
+        countries_total=int(countries_total) if countries_total else None,
+        error=job.get("error"),
+    )
+
+
+async def create_sync_job(redis: Redis, job_id: str) -> None:
+    """
+    Record a new pending sync job.
+    
+    Args:
+        redis: Redis connection
+        job_id: Job ID from new_sync_job_id
+    """
+    created_at = _job_score(job_id)
+    async with redis.pipeline(transaction=True) as pipe:
+        pipe.hset(_job_key(job_id), mapping=_encode_job_fields({"status": "pending", "countries_processed": 0}))
+        pipe.expire(_job_key(job_id), SYNC_JOB_TTL_SECONDS)
+        pipe.zadd(SYNC_JOBS_INDEX_KEY, {job_id: created_at})
+        # Drop index entries whose status hash has expired
+        pipe.zremrangebyscore(SYNC_JOBS_INDEX_KEY, "-inf", f"({created_at - SYNC_JOB_TTL_SECONDS}")
+        await pipe.execute()
+
+
+async def update_sync_job(redis: Redis, job_id: str, **fields: Any) -> None:
+    """
+    Update fields of a sync job's status.
+    
+    Args:
+        redis: Redis connection
+        job_id: Job ID
+        **fields: Status fields to set (None values are skipped)
+    """
+    mapping = _encode_job_fields(fields)
+    if not mapping:
+        return
+    
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.hset(_job_key(job_id), mapping=mapping)
+        # Only applies if the hash had expired and was recreated by this write
+        pipe.expire(_job_key(job_id), SYNC_JOB_TTL_SECONDS, nx=True)
+        await pipe.execute()
+
+
+async def _map_as_completed(
+    func: Callable[[T], Awaitable[R]],
+    items: Iterable[T],
+    concurrency: int
+) -> AsyncIterator[R]:
+    """
+    Run func over items with a sliding window of tasks, yielding results as they complete.
+    
+    A new task starts as soon as one finishes, so a slow item never holds up the
+    rest and only `concurrency` tasks exist at a time. func is expected to
+    handle per-item errors itself; like a TaskGroup, an exception that escapes
+    it cancels the remaining tasks and propagates.
+    
+    Args:
+        func: Coroutine function applied to each item
+        items: Items to process
+        concurrency: Maximum number of tasks in flight
+        
+    Yields:
+        Results in completion order
+    """
+    remaining = iter(items)
+    pending = {asyncio.ensure_future(func(item)) for item in islice(remaining, concurrency)}
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            # Refill the window before handing results on
+            pending.update(asyncio.ensure_future(func(item)) for item in islice(remaining, len(done)))
+            for task in done:
+                yield task.result()
+    finally:
+        # Stop outstanding requests on failure or if the consumer stops early
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
 
 
 async def sync_twilio_number_types(
-    account_sid: str,
-    auth_token: str,
-    job_id: Optional[str] = None
-) -> list[Dict]:
+    redis: Redis,
+    client: TwilioClient,
+    job_id: Optional[str] = None,
+    batch_size: int = SYNC_BATCH_SIZE
+) -> AsyncIterator[List[Dict]]:
     """
-    Background task to sync Twilio number types to database.
+    Fetch Twilio number types for every country, yielding them in batches.
+    
+    Countries are fetched batch_size at a time, so the caller can upsert one
+    batch while the next is being fetched. The caller marks the job completed
+    once every batch has been stored.
+    
+    The country list is always refetched: it is the source of the number
+    types being synced, and the fresh copy is then reused by regulations syncs.
     
     Args:
-        account_sid: Twilio Account SID
-        auth_token: Twilio Auth Token
+        redis: Redis connection holding the job status
+        client: Shared Twilio client (owned and closed by the caller)
         job_id: Optional job ID for tracking
+        batch_size: Number of countries fetched per batch
         
-    Returns:
-        List of country data dictionaries ready for database upsert
+    Yields:
+        Lists of country data dictionaries ready for database upsert
     """
     if job_id is None:
-        job_id = str(uuid.uuid4())
+        job_id = new_sync_job_id()
+        await create_sync_job(redis, job_id)
     
     # Initialize job status
-    sync_jobs[job_id] = {
-        "status": "in_progress",
-        "started_at": datetime.utcnow(),
-        "countries_processed": 0,
-        "countries_total": None,
-        "error": None,
-    }
+    await update_sync_job(redis, job_id, status="in_progress", started_at=datetime.utcnow())
     
     try:
-        # Create Twilio client
-        client = TwilioClient(account_sid, auth_token)
+        # Fetch all countries
+        logger.info(f"Job {job_id}: Fetching countries from Twilio API")
+        countries = await client.list_countries(force_refresh=True)
+        await update_sync_job(redis, job_id, countries_total=len(countries))
         
-        try:
-            # Fetch all countries
-            logger.info(f"Job {job_id}: Fetching countries from Twilio API")
-            countries = await client.list_countries()
-            sync_jobs[job_id]["countries_total"] = len(countries)
-            
-            # Process countries with concurrency limit
-            semaphore = asyncio.Semaphore(10)  # Limit to 10 concurrent requests
-            
-            async def process_country(country: Dict) -> None:
-                """Process a single country."""
-                async with semaphore:
-                    country_code = country.get("country_code")
-                    if not country_code:
-                        return
-                    
-                    try:
-                        # Fetch country details
-                        country_details = await client.get_country_details(country_code)
-                        
-                        # Extract number types
-                        number_types = client.extract_number_types(country_details)
-                        
-                        # Prepare data for upsert
-                        country_data = {
-                            "country_code": country_code,
-                            "country": country_details.get("country", ""),
-                            "beta": country_details.get("beta", False),
-                            **number_types,
-                        }
-                        
-                        # Upsert to database (will be done in batch)
-                        return country_data
-                    except Exception as e:
-                        logger.error(f"Error processing country {country_code}: {e}")
-                        return None
-            
-            # Process all countries concurrently
-            tasks = [process_country(country) for country in countries]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # Filter out None and exceptions
-            valid_results = [
-                r for r in results
-                if r is not None and not isinstance(r, Exception)
-            ]
-            
-            # Batch upsert to database
-            # Note: This requires a database session, which should be passed or created here
-            # For now, we'll return the data and handle upsert in the router
-            
-            sync_jobs[job_id]["countries_processed"] = len(valid_results)
-            sync_jobs[job_id]["status"] = "completed"
-            sync_jobs[job_id]["completed_at"] = datetime.utcnow()
-            
-            logger.info(f"Job {job_id}: Completed. Processed {len(valid_results)} countries")
-            
-            return valid_results
-            
-        finally:
-            await client.close()
+        async def process_country(country: Dict) -> Optional[Dict]:
+            """Process a single country."""
+            country_code = country.get("country_code")
+            if not country_code:
+                return None
             
+            try:
+                # The country list entries already carry subresource_uris; only
+                # fetch the country resource if this one does not
+                if "subresource_uris" in country:
+                    country_details = country
+                else:
+                    country_details = await client.get_country_details(country_code)
+                
+                # Extract number types
+                number_types = client.extract_number_types(country_details)
+                
+                # Prepare data for upsert
+                country_data = {
+                    "country_code": country_code,
+                    "country": country_details.get("country", ""),
+                    "beta": country_details.get("beta", False),
+                    **number_types,
+                }
+                
+                return country_data
+            except Exception as e:
+                logger.error(f"Error processing country {country_code}: {e}")
+                return None
+        
+        # Keep SYNC_CONCURRENCY requests in flight and hand on each batch_size
+        # countries as they complete
+        countries_processed = 0
+        batch = []
+        async with aclosing(_map_as_completed(process_country, countries, SYNC_CONCURRENCY)) as results:
+            async for country_data in results:
+                if country_data is None:
+                    continue
+                batch.append(country_data)
+                if len(batch) == batch_size:
+                    countries_processed += len(batch)
+                    await update_sync_job(redis, job_id, countries_processed=countries_processed)
+                    yield batch
+                    batch = []
+        
+        if batch:
+            countries_processed += len(batch)
+            await update_sync_job(redis, job_id, countries_processed=countries_processed)
+            yield batch
+        
+        logger.info(f"Job {job_id}: Fetched {countries_processed} countries")
+        
     except Exception as e:
         logger.error(f"Job {job_id}: Error during sync: {e}")
-        sync_jobs[job_id]["status"] = "failed"
-        sync_jobs[job_id]["error"] = str(e)
-        sync_jobs[job_id]["completed_at"] = datetime.utcnow()
+        await update_sync_job(redis, job_id, status="failed", error=str(e), completed_at=datetime.utcnow())
         raise
 
 
@@ -135,151 +300,165 @@ async def upsert_countries_to_db(
         return
     
     # Prepare data for bulk upsert
-    values = []
-    for country in countries_data:
-        values.append({
-            "country_code": country["country_code"],
-            "country": country["country"],
-            "beta": country["beta"],
-            "local": country["local"],
-            "toll_free": country["toll_free"],
-            "mobile": country["mobile"],
-            "national": country["national"],
-            "voip": country["voip"],
-            "shared_cost": country["shared_cost"],
-            "machine_to_machine": country["machine_to_machine"],
-        })
+    values = [{name: country[name] for name in COUNTRY_COLUMNS} for country in countries_data]
     
-    # Use PostgreSQL INSERT ... ON CONFLICT for upsert
-    stmt = insert(CountryNumberTypes).values(values)
-    stmt = stmt.on_conflict_do_update(
-        index_elements=["country_code"],
-        set_=dict(
-            country=stmt.excluded.country,
-            beta=stmt.excluded.beta,
-            local=stmt.excluded.local,
-            toll_free=stmt.excluded.toll_free,
-            mobile=stmt.excluded.mobile,
-            national=stmt.excluded.national,
-            voip=stmt.excluded.voip,
-            shared_cost=stmt.excluded.shared_cost,
-            machine_to_machine=stmt.excluded.machine_to_machine,
-            last_updated=func.now(),
+    # Use PostgreSQL INSERT ... ON CONFLICT for upsert, UPSERT_CHUNK_SIZE rows per statement
+    for start in range(0, len(values), UPSERT_CHUNK_SIZE):
+        stmt = insert(CountryNumberTypes).values(values[start:start + UPSERT_CHUNK_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[COUNTRY_COLUMNS[0]],
+            set_={name: stmt.excluded[name] for name in COUNTRY_COLUMNS[1:]} | {"last_updated": func.now()},
         )
-    )
+        await db.execute(stmt)
     
-    await db.execute(stmt)
     await db.commit()
     
     logger.info(f"Upserted {len(values)} countries to database")
 
 
-def get_sync_job_status(job_id: str) -> Optional[Dict]:
+async def get_sync_job_status(redis: Redis, job_id: str) -> Optional[SyncJobState]:
     """Get status of a sync job."""
-    return sync_jobs.get(job_id)
+    raw = await redis.hgetall(_job_key(job_id))
+    return _decode_job(job_id, raw) if raw else None
+
+
+async def list_sync_job_statuses(redis: Redis, limit: int, after: Optional[str] = None) -> List[SyncJobState]:
+    """
+    Get a page of sync jobs, newest first.
+    
+    Args:
+        redis: Redis connection
+        limit: Maximum number of jobs to return
+        after: Optional job ID cursor; only jobs created before it are returned
+        
+    Returns:
+        List of job statuses
+        
+    Raises:
+        ValueError: If after is not a valid job ID
+    """
+    if after is None:
+        raw_ids = await redis.zrevrange(SYNC_JOBS_INDEX_KEY, 0, limit - 1)
+    else:
+        # Jobs sharing a millisecond score are ordered by ID, which for ULIDs is
+        # creation order, so the page starts right after the cursor's rank
+        rank = await redis.zrevrank(SYNC_JOBS_INDEX_KEY, after)
+        if rank is not None:
+            raw_ids = await redis.zrevrange(SYNC_JOBS_INDEX_KEY, rank + 1, rank + limit)
+        else:
+            # Cursor job has left the index: continue from its creation time
+            raw_ids = await redis.zrevrangebyscore(
+                SYNC_JOBS_INDEX_KEY, f"({_job_score(after)}", "-inf", start=0, num=limit
+            )
+    
+    job_ids = [job_id.decode() for job_id in raw_ids]
+    if not job_ids:
+        return []
+    
+    async with redis.pipeline(transaction=False) as pipe:
+        for job_id in job_ids:
+            pipe.hgetall(_job_key(job_id))
+        raw_jobs = await pipe.execute()
+    
+    return [_decode_job(job_id, raw) for job_id, raw in zip(job_ids, raw_jobs) if raw]
 
 
 async def sync_twilio_regulations(
-    account_sid: str,
-    auth_token: str,
-    job_id: Optional[str] = None
-) -> list[Dict]:
+    redis: Redis,
+    client: TwilioClient,
+    job_id: Optional[str] = None,
+    batch_size: int = SYNC_BATCH_SIZE,
+    refresh_countries: bool = False
+) -> AsyncIterator[List[Dict]]:
     """
-    Background task to sync Twilio regulatory compliance regulations to database.
+    Fetch Twilio regulatory compliance regulations for every country, yielding them in batches.
+    
+    Countries are processed batch_size at a time and their regulations are
+    yielded together, so the caller can upsert one batch while the next is
+    being fetched. The caller marks the job completed once every batch has
+    been stored.
     
     Args:
-        account_sid: Twilio Account SID
-        auth_token: Twilio Auth Token
+        redis: Redis connection holding the job status
+        client: Shared Twilio client (owned and closed by the caller)
         job_id: Optional job ID for tracking
+        batch_size: Number of countries processed per batch
+        refresh_countries: Refetch the country list instead of reusing the
+            client's cached copy (see TwilioClient.list_countries)
         
-    Returns:
-        List of regulation data dictionaries ready for database upsert
+    Yields:
+        Lists of regulation data dictionaries ready for database upsert
     """
     if job_id is None:
-        job_id = str(uuid.uuid4())
+        job_id = new_sync_job_id()
+        await create_sync_job(redis, job_id)
     
     # Initialize job status
-    sync_jobs[job_id] = {
-        "status": "in_progress",
-        "started_at": datetime.utcnow(),
-        "countries_processed": 0,
-        "countries_total": None,
-        "error": None,
-    }
+    await update_sync_job(redis, job_id, status="in_progress", started_at=datetime.utcnow())
     
     try:
-        # Create Twilio client
-        client = TwilioClient(account_sid, auth_token)
+        # First, get list of all countries
+        logger.info(f"Job {job_id}: Fetching countries from Twilio API")
+        countries = await client.list_countries(force_refresh=refresh_countries)
+        await update_sync_job(redis, job_id, countries_total=len(countries))
         
-        try:
-            # First, get list of all countries
-            logger.info(f"Job {job_id}: Fetching countries from Twilio API")
-            countries = await client.list_countries()
-            sync_jobs[job_id]["countries_total"] = len(countries)
-            
-            # Process countries with concurrency limit
-            semaphore = asyncio.Semaphore(10)  # Limit to 10 concurrent requests
-            
-            async def process_country_regulations(country: Dict) -> List[Dict]:
-                """Process regulations for a single country."""
-                async with semaphore:
-                    country_code = country.get("country_code")
-                    if not country_code:
-                        return []
-                    
-                    try:
-                        # Fetch regulations for this country (always business end user type)
-                        regulations = await client.list_regulations(
-                            country_code=country_code,
-                            include_constraints=True
-                        )
-                        
-                        # Prepare data for upsert
-                        regulations_data = []
-                        for reg in regulations:
-                            regulations_data.append({
-                                "sid": reg.get("sid"),
-                                "friendly_name": reg.get("friendly_name"),
-                                "iso_country": reg.get("iso_country"),
-                                "number_type": reg.get("number_type"),
-                                "end_user_type": "business",  # Always business
-                                "requirements": reg.get("requirements"),
-                                "url": reg.get("url"),
-                            })
-                        
-                        return regulations_data
-                    except Exception as e:
-                        logger.error(f"Error processing regulations for country {country_code}: {e}")
-                        return []
-            
-            # Process all countries concurrently
-            tasks = [process_country_regulations(country) for country in countries]
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # Flatten results and filter out exceptions
-            all_regulations = []
-            for result in results:
-                if isinstance(result, Exception):
-                    logger.error(f"Exception in regulation sync: {result}")
-                elif isinstance(result, list):
-                    all_regulations.extend(result)
-            
-            sync_jobs[job_id]["countries_processed"] = len(countries)
-            sync_jobs[job_id]["status"] = "completed"
-            sync_jobs[job_id]["completed_at"] = datetime.utcnow()
-            
-            logger.info(f"Job {job_id}: Completed. Processed {len(all_regulations)} regulations from {len(countries)} countries")
-            
-            return all_regulations
-            
-        finally:
-            await client.close()
+        async def process_country_regulations(country: Dict) -> List[Dict]:
+            """Process regulations for a single country."""
+            country_code = country.get("country_code")
+            if not country_code:
+                return []
             
+            try:
+                # Fetch regulations for this country (always business end user type)
+                regulations = await client.list_regulations(
+                    country_code=country_code,
+                    include_constraints=True
+                )
+                
+                # Prepare data for upsert
+                regulations_data = []
+                for reg in regulations:
+                    regulations_data.append({
+                        "sid": reg.get("sid"),
+                        "friendly_name": reg.get("friendly_name"),
+                        "iso_country": reg.get("iso_country"),
+                        "number_type": reg.get("number_type"),
+                        "end_user_type": "business",  # Always business
+                        "requirements": reg.get("requirements"),
+                        "url": reg.get("url"),
+                    })
+                
+                return regulations_data
+            except Exception as e:
+                logger.error(f"Error processing regulations for country {country_code}: {e}")
+                return []
+        
+        # Keep SYNC_CONCURRENCY countries in flight and hand on the regulations
+        # of each batch_size countries as they complete
+        regulations_total = 0
+        countries_processed = 0
+        batch_regulations = []
+        async with aclosing(_map_as_completed(process_country_regulations, countries, SYNC_CONCURRENCY)) as results:
+            async for regulations_data in results:
+                batch_regulations.extend(regulations_data)
+                countries_processed += 1
+                if countries_processed % batch_size == 0:
+                    await update_sync_job(redis, job_id, countries_processed=countries_processed)
+                    if batch_regulations:
+                        regulations_total += len(batch_regulations)
+                        yield batch_regulations
+                        batch_regulations = []
+        
+        await update_sync_job(redis, job_id, countries_processed=countries_processed)
+        if batch_regulations:
+            regulations_total += len(batch_regulations)
+            yield batch_regulations
+        
+        logger.info(f"Job {job_id}: Fetched {regulations_total} regulations from {len(countries)} countries")
+        
     except Exception as e:
         logger.error(f"Job {job_id}: Error during regulation sync: {e}")
-        sync_jobs[job_id]["status"] = "failed"
-        sync_jobs[job_id]["error"] = str(e)
-        sync_jobs[job_id]["completed_at"] = datetime.utcnow()
+        await update_sync_job(redis, job_id, status="failed", error=str(e), completed_at=datetime.utcnow())
         raise
 
 
@@ -302,35 +481,22 @@ async def upsert_regulations_to_db(
     for reg in regulations_data:
         if not reg.get("sid"):
             continue  # Skip if no SID
-        values.append({
-            "sid": reg["sid"],
-            "friendly_name": reg.get("friendly_name"),
-            "iso_country": reg.get("iso_country"),
-            "number_type": reg.get("number_type"),
-            "end_user_type": reg.get("end_user_type", "business"),
-            "requirements": reg.get("requirements"),
-            "url": reg.get("url"),
-        })
+        row = {name: reg.get(name) for name in REGULATION_COLUMNS}
+        row["end_user_type"] = row["end_user_type"] or "business"
+        values.append(row)
     
     if not values:
         return
     
-    # Use PostgreSQL INSERT ... ON CONFLICT for upsert
-    stmt = insert(Regulation).values(values)
-    stmt = stmt.on_conflict_do_update(
-        index_elements=["sid"],
-        set_=dict(
-            friendly_name=stmt.excluded.friendly_name,
-            iso_country=stmt.excluded.iso_country,
-            number_type=stmt.excluded.number_type,
-            end_user_type=stmt.excluded.end_user_type,
-            requirements=stmt.excluded.requirements,
-            url=stmt.excluded.url,
-            last_updated=func.now(),
+    # Use PostgreSQL INSERT ... ON CONFLICT for upsert, UPSERT_CHUNK_SIZE rows per statement
+    for start in range(0, len(values), UPSERT_CHUNK_SIZE):
+        stmt = insert(Regulation).values(values[start:start + UPSERT_CHUNK_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[REGULATION_COLUMNS[0]],
+            set_={name: stmt.excluded[name] for name in REGULATION_COLUMNS[1:]} | {"last_updated": func.now()},
         )
-    )
+        await db.execute(stmt)
     
-    await db.execute(stmt)
     await db.commit()
     
     logger.info(f"Upserted {len(values)} regulations to database")
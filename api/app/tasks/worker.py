@@ -0,0 +1,216 @@
+"""arq worker that runs Twilio sync jobs outside the API process.
+
+Run with: arq app.tasks.worker.WorkerSettings
+"""
+from contextlib import aclosing
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List
+import asyncio
+import logging
+
+from arq.connections import RedisSettings
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import get_settings
+from app.database import AsyncSessionLocal, engine
+from app.services.twilio_client import TwilioClient
+from app.services.cache import (
+    response_cache,
+    COUNTRIES_NAMESPACE,
+    REGULATIONS_NAMESPACE,
+    COUNTRIES_UPDATED_CHANNEL,
+)
+from app.tasks.sync_task import (
+    sync_twilio_number_types,
+    upsert_countries_to_db,
+    sync_twilio_regulations,
+    upsert_regulations_to_db,
+    update_sync_job,
+    UPSERT_CHUNK_SIZE,
+)
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Connection settings shared by the worker and the API's enqueue pool
+REDIS_SETTINGS = RedisSettings.from_dsn(settings.redis_url)
+
+# Fetched batches allowed to wait for the database writer before fetching pauses
+PIPELINE_QUEUE_SIZE = 4
+
+
+@dataclass(slots=True)
+class UpsertProgress:
+    """Rows committed so far by a sync pipeline (kept when the pipeline fails partway)."""
+    rows_upserted: int = 0
+
+
+async def _fetch_and_upsert(
+    batches: AsyncIterator[List[Dict]],
+    upsert: Callable[[AsyncSession, List[Dict]], Awaitable[None]],
+    progress: UpsertProgress
+) -> None:
+    """
+    Upsert batches from a sync generator while the next batches are fetched.
+    
+    A producer task pulls batches from Twilio into a bounded queue and a
+    consumer task writes them with its own session, so Twilio requests and
+    database commits overlap. Batches that queue up while a write is running
+    are combined into the next write, up to UPSERT_CHUNK_SIZE rows.
+    
+    Args:
+        batches: Async iterator of row batches (e.g. sync_twilio_number_types)
+        upsert: Upsert function called with a session and one batch
+        progress: Updated after every committed write, so the caller knows
+            what reached the database even if a later batch fails
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=PIPELINE_QUEUE_SIZE)
+    
+    async def produce() -> None:
+        async with aclosing(batches):
+            async for batch in batches:
+                await queue.put(batch)
+        await queue.put(None)
+    
+    async def consume() -> None:
+        async with AsyncSessionLocal() as db:
+            finished = False
+            while not finished and (batch := await queue.get()) is not None:
+                rows = list(batch)
+                while len(rows) < UPSERT_CHUNK_SIZE and not queue.empty():
+                    if (batch := queue.get_nowait()) is None:
+                        finished = True
+                        break
+                    rows.extend(batch)
+                await upsert(db, rows)
+                progress.rows_upserted += len(rows)
+    
+    try:
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(produce())
+            tg.create_task(consume())
+    except ExceptionGroup as eg:
+        # Report the underlying failure rather than the group wrapper
+        raise eg.exceptions[0]
+
+
+async def sync_countries_job(ctx: Dict[str, Any], job_id: str) -> None:
+    """
+    Sync Twilio number types and upsert them to the database.
+    
+    The worker's shared Twilio client is built from settings at startup, so
+    credentials are never written to the job payload in Redis.
+    
+    Args:
+        ctx: arq job context
+        job_id: Job ID recorded when the sync was triggered
+    """
+    redis = ctx["redis"]
+    progress = UpsertProgress()
+    try:
+        # Fetch countries and upsert them batch by batch
+        await _fetch_and_upsert(
+            sync_twilio_number_types(redis, ctx["twilio_client"], job_id),
+            upsert_countries_to_db,
+            progress,
+        )
+        await update_sync_job(redis, job_id, status="completed", completed_at=datetime.utcnow())
+        logger.info(f"Job {job_id}: Completed. Upserted {progress.rows_upserted} countries")
+    
+    except asyncio.CancelledError:
+        # Raised when the job exceeds job_timeout or the worker shuts down mid-job;
+        # record it so the job does not stay in_progress until its TTL expires
+        logger.error(f"Sync task {job_id} cancelled after upserting {progress.rows_upserted} countries")
+        await update_sync_job(
+            redis, job_id, status="failed", error="Job cancelled or timed out", completed_at=datetime.utcnow()
+        )
+        raise
+    
+    except Exception as e:
+        logger.error(f"Sync task {job_id} failed after upserting {progress.rows_upserted} countries: {e}")
+        await update_sync_job(redis, job_id, status="failed", error=str(e), completed_at=datetime.utcnow())
+    
+    finally:
+        # Batches are committed as they arrive, so a failed sync can still have changed data
+        if progress.rows_upserted:
+            # Country types also drive the only_available_types regulation filter
+            await response_cache.invalidate(COUNTRIES_NAMESPACE)
+            await response_cache.invalidate(REGULATIONS_NAMESPACE)
+            # Let every API process rebuild its country list snapshot
+            await redis.publish(COUNTRIES_UPDATED_CHANNEL, job_id)
+
+
+async def sync_regulations_job(ctx: Dict[str, Any], job_id: str, refresh_countries: bool = False) -> None:
+    """
+    Sync Twilio regulations and upsert them to the database.
+    
+    Args:
+        ctx: arq job context
+        job_id: Job ID recorded when the sync was triggered
+        refresh_countries: Refetch the country list rather than reuse the
+            list cached by an earlier job within COUNTRIES_CACHE_TTL_SECONDS
+    """
+    redis = ctx["redis"]
+    progress = UpsertProgress()
+    try:
+        # Fetch regulations and upsert them batch by batch
+        await _fetch_and_upsert(
+            sync_twilio_regulations(redis, ctx["twilio_client"], job_id, refresh_countries=refresh_countries),
+            upsert_regulations_to_db,
+            progress,
+        )
+        await update_sync_job(redis, job_id, status="completed", completed_at=datetime.utcnow())
+        logger.info(f"Job {job_id}: Completed. Upserted {progress.rows_upserted} regulations")
+    
+    except asyncio.CancelledError:
+        logger.error(f"Regulations sync task {job_id} cancelled after upserting {progress.rows_upserted} regulations")
+        await update_sync_job(
+            redis, job_id, status="failed", error="Job cancelled or timed out", completed_at=datetime.utcnow()
+        )
+        raise
+    
+    except Exception as e:
+        logger.error(f"Regulations sync task {job_id} failed after upserting {progress.rows_upserted} regulations: {e}")
+        await update_sync_job(redis, job_id, status="failed", error=str(e), completed_at=datetime.utcnow())
+    
+    finally:
+        # Batches are committed as they arrive, so a failed sync can still have changed data
+        if progress.rows_upserted:
+            await response_cache.invalidate(REGULATIONS_NAMESPACE)
+
+
+async def startup(ctx: Dict[str, Any]) -> None:
+    """
+    Open the response cache and the Twilio client shared by every sync job.
+    
+    Raises:
+        RuntimeError: If Twilio credentials are not configured, since every
+            job this worker runs needs them
+    """
+    if not settings.twilio_credentials_configured:
+        raise RuntimeError(
+            "Twilio credentials are not configured. Please set TWILIO_ACCOUNT_SID and TWILIO_AUTH_TOKEN environment variables."
+        )
+    response_cache.init(host_url=settings.redis_url, prefix="tns-cache")
+    # One client for the worker's lifetime, so connections stay warm across jobs
+    ctx["twilio_client"] = TwilioClient(settings.twilio_account_sid, settings.twilio_auth_token)
+
+
+async def shutdown(ctx: Dict[str, Any]) -> None:
+    """Close the Twilio client and response cache and dispose the database engine."""
+    # arq still runs shutdown when startup failed before the client was created
+    if ctx.get("twilio_client") is not None:
+        await ctx["twilio_client"].close()
+    await response_cache.close()
+    await engine.dispose()
+
+
+class WorkerSettings:
+    """arq worker configuration."""
+    functions = [sync_countries_job, sync_regulations_job]
+    redis_settings = REDIS_SETTINGS
+    on_startup = startup
+    on_shutdown = shutdown
+    # A full regulations sync walks every country, well past arq's 5 minute default
+    job_timeout = 60 * 60